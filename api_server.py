@@ -0,0 +1,477 @@
+import argparse
+import heapq
+import itertools
+import json
+import os
+import selectors
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from genotype_parser import CHUNK_SIZE
+from instrumentation import logger, track_request
+from nutrigene_core import analyze_genotype_file, cached_panel_report_path, cached_report_path, resolve_panel
+from panel import PanelResolver, summarize_panel
+from report_cache import ReportCache
+from risk_chart import CHART_MODES, warm_chart_cache_in_background
+from kb_reload import DEFAULT_SOURCE, KnowledgeBaseWatcher
+
+DEFAULT_WORKERS = int(os.environ.get("NUTRIGENE_API_WORKERS", 8))
+DEFAULT_QUEUE_SIZE = int(os.environ.get("NUTRIGENE_API_QUEUE", 64))
+# Keep-alive connections waiting for their next request; beyond this, finished connections are closed
+MAX_IDLE_CONNECTIONS = int(os.environ.get("NUTRIGENE_API_MAX_IDLE", 1024))
+# How long a rejected connection may take to send its request before the 503 goes out anyway
+REJECT_WAIT_SECONDS = 0.5
+MAX_UPLOAD_BYTES = int(float(os.environ.get("NUTRIGENE_API_MAX_UPLOAD_MB", 100)) * 1024 * 1024)
+# Uploads stay in memory up to this size and spill to a temporary file beyond it
+SPOOL_BYTES = 8 * 1024 * 1024
+
+PDF_TYPE = "application/pdf"
+JSON_TYPE = "application/json"
+
+
+class APIError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class NutriGeneHandler(BaseHTTPRequestHandler):
+    """JSON/PDF endpoints over the same lookup and report code as the Streamlit app.
+
+    ``GET /health``, ``GET /snp/<rsid>[?genotype=TT]``, ``POST /panel`` (panel text,
+    or JSON ``{"panel": ...}``) and ``POST /analyze`` (a raw genotype file as the
+    body). Add ``?format=pdf`` or ``Accept: application/pdf`` for the PDF report.
+    """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "NutriGene/1.0"
+    # Idle keep-alive connections are closed after this many seconds, as are requests stalled mid-read
+    timeout = 10
+    # Headers and body go out as separate writes; without this each response waits on a delayed ACK
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        # One request per turn on a worker; between requests a keep-alive connection
+        # waits on the server's connection watcher instead of holding the worker
+        self.close_connection = True
+        try:
+            self.handle_one_request()
+        except BaseException:
+            self.close_connection = True # so finish() closes the streams
+            raise
+
+    def finish(self):
+        if self.close_connection:
+            super().finish()
+
+    def serve_next(self):
+        """Answer the next request on a kept-alive connection."""
+        try:
+            self.handle()
+        finally:
+            self.finish()
+
+    def has_buffered_request(self):
+        # A pipelined request may already sit in rfile's buffer, where a selector cannot see it
+        self.connection.setblocking(False)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def close(self):
+        self.close_connection = True
+        self.finish()
+
+    def do_GET(self):
+        self._dispatch({"/health": self._health, "/snp": self._snp})
+
+    def do_POST(self):
+        self._dispatch({"/panel": self._panel, "/analyze": self._analyze})
+
+    def _dispatch(self, routes):
+        url = urlsplit(self.path)
+        endpoint, _, arg = url.path.rstrip("/").partition("/")[2].partition("/")
+        handler = routes.get("/" + endpoint)
+        # The whole request is answered from one knowledge-base snapshot, even across a reload
+        self.snp_index = self.server.knowledge_base.snapshot()
+        with track_request("api", endpoint=endpoint or "/", method=self.command):
+            try:
+                if handler is None:
+                    raise APIError(404, f"Unknown endpoint: {url.path}")
+                handler(unquote(arg), parse_qs(url.query))
+            except APIError as e:
+                self._discard_body()
+                self._send_json(e.status, {"error": str(e)})
+            except Exception:
+                logger.exception("API request %s %s failed", self.command, self.path)
+                self._discard_body()
+                self._send_json(500, {"error": "Internal server error"})
+
+    # --- endpoints ---
+
+    def _health(self, arg, query):
+        index = self.snp_index
+        self._send_json(200, {"status": "ok", "records": len(index), "knowledge_base": index.fingerprint()[:16]})
+
+    def _snp(self, rsid, query):
+        if not rsid:
+            raise APIError(400, "Expected /snp/<rsid>")
+        index = self.snp_index
+        genotype = query.get("genotype", [None])[0]
+        records = index.lookup_genotype(rsid, genotype) if genotype else index.lookup(rsid)
+        if not records:
+            raise APIError(404, f"No matching SNP found for ID: {rsid.upper()}")
+        if self._wants_pdf(query):
+            report_cache = self.server.report_cache(index)
+            self._send_pdf(cached_report_path(report_cache, records, self.server.chart_mode), rsid.lower())
+        else:
+            self._send_json(200, {"snp": rsid.lower(), "records": records})
+
+    def _panel(self, arg, query):
+        body = self._read_body(MAX_UPLOAD_BYTES).decode("utf-8", "replace")
+        panel_text = body
+        if (self.headers.get("Content-Type") or "").startswith(JSON_TYPE):
+            try:
+                panel_text = json.loads(body or "{}").get("panel", "")
+            except (ValueError, AttributeError):
+                raise APIError(400, 'Expected a JSON object like {"panel": "rs1801133 TT\\nrs4988235"}')
+            if isinstance(panel_text, list):
+                panel_text = "\n".join(map(str, panel_text))
+        records, unmatched = resolve_panel(self.server.panel_resolver(self.snp_index), str(panel_text))
+        if not records and not unmatched:
+            raise APIError(400, "No SNP IDs found in the panel")
+        if self._wants_pdf(query):
+            if not records:
+                raise APIError(404, "None of the panel's SNP IDs were found in the knowledge base")
+            report_cache = self.server.report_cache(self.snp_index)
+            report_path = cached_panel_report_path(report_cache, records, self.server.chart_mode, unmatched)
+            self._send_pdf(report_path, "panel")
+        else:
+            self._send_json(200, {"records": records, "unmatched": unmatched, "summary": summarize_panel(records)})
+
+    def _analyze(self, arg, query):
+        with self._spool_body() as upload:
+            records = analyze_genotype_file(self.snp_index, upload)
+        if self._wants_pdf(query):
+            if not records:
+                raise APIError(404, "No variants from the knowledge base were found in the upload")
+            report_cache = self.server.report_cache(self.snp_index)
+            self._send_pdf(cached_report_path(report_cache, records, self.server.chart_mode), "upload")
+        else:
+            self._send_json(200, {"records": records})
+
+    # --- request and response helpers ---
+
+    def _wants_pdf(self, query):
+        return query.get("format", [""])[0].lower() == "pdf" or PDF_TYPE in (self.headers.get("Accept") or "")
+
+    def _content_length(self, limit):
+        length = self.headers.get("Content-Length")
+        if length is None:
+            raise APIError(411, "Content-Length is required")
+        try:
+            length = int(length)
+        except ValueError:
+            raise APIError(400, "Invalid Content-Length")
+        if length > limit:
+            self.close_connection = True
+            raise APIError(413, f"Request body is larger than {limit // (1024 * 1024)} MB")
+        return length
+
+    def _read_body(self, limit):
+        length = self._content_length(limit)
+        self._body_read = True
+        return self.rfile.read(length)
+
+    def _spool_body(self):
+        # Large raw files are copied in chunks, so a request never holds the whole upload twice
+        remaining = self._content_length(MAX_UPLOAD_BYTES)
+        self._body_read = True
+        upload = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        while remaining:
+            chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            upload.write(chunk)
+            remaining -= len(chunk)
+        upload.seek(0)
+        return upload
+
+    def _discard_body(self):
+        # An unread body would be parsed as the next request on a keep-alive connection
+        if self.command == "POST" and not getattr(self, "_body_read", False):
+            self.close_connection = True
+
+    def _send_headers(self, status, content_type, length, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(length))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+
+    def _send(self, status, content_type, body, headers=()):
+        self._send_headers(status, content_type, len(body), headers)
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send(status, JSON_TYPE + "; charset=utf-8", body)
+
+    def _send_pdf(self, report_path, name):
+        # Sent from the report cache file by the kernel; the PDF is never read into memory here
+        with open(report_path, "rb") as f:
+            length = os.fstat(f.fileno()).st_size
+            self._send_headers(200, PDF_TYPE, length,
+                               [("Content-Disposition", f'attachment; filename="nutrigene_report_{name}.pdf"')])
+            self.connection.sendfile(f)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class ConnectionWatcher:
+    """Waits on one selector thread until watched sockets become readable or time out.
+
+    ``watch(sock, timeout, callback)`` calls ``callback(True)`` once data (or EOF)
+    arrives, or ``callback(False)`` after ``timeout`` seconds; either way the socket
+    is no longer watched. Callbacks run on the watcher thread and must not block.
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._lock = threading.Lock()
+        self._incoming = []
+        self._watched = {}
+        self._deadlines = []
+        self._order = itertools.count()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="nutrigene-api-watch", daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return len(self._watched) + len(self._incoming)
+
+    def watch(self, sock, timeout, callback):
+        with self._lock:
+            self._incoming.append((sock, time.monotonic() + timeout, callback))
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except BlockingIOError:
+            pass # a wake-up is already pending
+
+    def _run(self):
+        while not self._stopped:
+            timeout = max(0.0, self._deadlines[0][0] - time.monotonic()) if self._deadlines else None
+            for key, _ in self._selector.select(timeout):
+                if key.fileobj is self._wake_r:
+                    while True:
+                        try:
+                            if not self._wake_r.recv(4096):
+                                break
+                        except BlockingIOError:
+                            break
+                    continue
+                self._done(key.fileobj, True)
+            with self._lock:
+                incoming, self._incoming = self._incoming, []
+            for sock, deadline, callback in incoming:
+                try:
+                    self._selector.register(sock, selectors.EVENT_READ)
+                except (ValueError, OSError):
+                    callback(True) # closed meanwhile; the callback finds out
+                    continue
+                entry = (deadline, next(self._order), sock)
+                self._watched[sock] = (entry, callback)
+                heapq.heappush(self._deadlines, entry)
+            now = time.monotonic()
+            while self._deadlines and self._deadlines[0][0] <= now:
+                entry = heapq.heappop(self._deadlines)
+                watched = self._watched.get(entry[2])
+                if watched is not None and watched[0] is entry:
+                    self._done(entry[2], False)
+            # Entries already handled are dropped lazily; rebuild before they dominate the heap
+            if len(self._deadlines) > 2 * len(self._watched) + 64:
+                self._deadlines = [entry for entry, _ in self._watched.values()]
+                heapq.heapify(self._deadlines)
+
+    def _done(self, sock, ready):
+        _, callback = self._watched.pop(sock)
+        self._selector.unregister(sock)
+        try:
+            callback(ready)
+        except Exception:
+            logger.exception("Connection watcher callback failed")
+
+    def close(self):
+        self._stopped = True
+        self._wake()
+        self._thread.join()
+        callbacks = [callback for _, callback in self._watched.values()]
+        callbacks += [callback for _, _, callback in self._incoming]
+        self._watched.clear()
+        self._incoming = []
+        for callback in callbacks:
+            callback(False)
+        self._selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+
+class NutriGeneServer(HTTPServer):
+    """HTTP server that hands requests to a bounded worker pool.
+
+    At most ``workers`` requests are served at once and ``queue_size`` more wait
+    for a worker; anything beyond that is answered ``503`` straight away instead
+    of piling up behind the others. Keep-alive connections only take a slot while
+    a request is in flight: between requests they wait on a ``ConnectionWatcher``
+    and are closed after ``NutriGeneHandler.timeout`` idle seconds.
+    """
+
+    request_queue_size = 128
+
+    def __init__(self, address, knowledge_base, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE,
+                 chart_mode=None):
+        super().__init__(address, NutriGeneHandler)
+        self.knowledge_base = knowledge_base
+        self.chart_mode = chart_mode
+        self._report_cache = None
+        self._report_cache_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nutrigene-api")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._watcher = ConnectionWatcher()
+
+    def report_cache(self, index):
+        # Reports are cached per knowledge-base version; a reload starts a fresh cache
+        with self._report_cache_lock:
+            if self._report_cache is None or self._report_cache.prefix != index.fingerprint()[:16]:
+                self._report_cache = ReportCache(index.fingerprint())
+            return self._report_cache
+
+    def panel_resolver(self, index):
+        # The pandas frame is only built once the first panel arrives, then patched on reload
+        return self.knowledge_base.derived(
+            "panel_resolver", PanelResolver, lambda resolver, change: resolver.updated(*change), index
+        )
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            self._reject(request, client_address)
+            return
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        # A new connection: the handler answers its first request
+        handler = None
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+        self._request_done(request, handler)
+
+    def _resume(self, handler):
+        try:
+            handler.serve_next()
+        except Exception:
+            self.handle_error(handler.request, handler.client_address)
+            handler.close_connection = True
+        self._request_done(handler.request, handler)
+
+    def _request_done(self, request, handler):
+        self._slots.release()
+        if handler is None or handler.close_connection:
+            self.shutdown_request(request)
+        elif handler.has_buffered_request():
+            self._next_request(handler, True)
+        elif len(self._watcher) >= MAX_IDLE_CONNECTIONS:
+            handler.close()
+            self.shutdown_request(request)
+        else:
+            self._watcher.watch(request, handler.timeout, lambda ready: self._next_request(handler, ready))
+
+    def _next_request(self, handler, ready):
+        if not ready:
+            handler.close() # idle for too long
+            self.shutdown_request(handler.request)
+        elif self._slots.acquire(blocking=False):
+            self._pool.submit(self._resume, handler)
+        else:
+            logger.warning("Worker pool and queue full; rejecting %s", handler.client_address[0])
+            handler.close()
+            self._send_busy(handler.request)
+
+    def _reject(self, request, client_address):
+        # The serve thread never waits on a rejected client: its request is awaited by the watcher
+        logger.warning("Worker pool and queue full; rejecting %s", client_address[0])
+        self._watcher.watch(request, REJECT_WAIT_SECONDS, lambda ready: self._send_busy(request))
+
+    def _send_busy(self, request):
+        body = json.dumps({"error": "Server busy, retry shortly"}).encode("utf-8")
+        try:
+            request.setblocking(False)
+            # Drain what the client already sent so closing does not reset the connection
+            try:
+                while request.recv(65536):
+                    pass
+            except BlockingIOError:
+                pass
+            # Small enough for the socket's send buffer, so this never blocks either
+            request.send(
+                b"HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\n"
+                b"Retry-After: 1\r\nConnection: close\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body
+            )
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
+        self._watcher.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve NutriGene lookups and reports over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("-p", "--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument("-j", "--workers", type=int, default=DEFAULT_WORKERS, help="Requests served at once")
+    parser.add_argument("--queue", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Requests allowed to wait for a worker before new ones get 503")
+    parser.add_argument("--chart-mode", choices=CHART_MODES, default=None,
+                        help="Embed risk charts as cached PNGs (raster) or draw them natively (vector)")
+    parser.add_argument("--kb", default=DEFAULT_SOURCE, help="Knowledge-base file to serve and watch for edits")
+    args = parser.parse_args(argv)
+
+    warm_chart_cache_in_background()
+    server = NutriGeneServer((args.host, args.port), KnowledgeBaseWatcher(args.kb).start(), args.workers, args.queue,
+                             chart_mode=args.chart_mode)
+    print(f"NutriGene API listening on http://{args.host}:{server.server_port} "
+          f"({args.workers} workers, queue {args.queue})", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
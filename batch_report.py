@@ -0,0 +1,138 @@
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from instrumentation import track_request
+from nutrigene_core import analyze_genotype_file, build_report
+from risk_chart import CHART_MODES, warm_chart_cache
+from snp_index import build_default_index
+
+SAMPLE_EXTENSIONS = (".txt", ".csv", ".tsv", ".vcf", ".gz")
+
+# Per-process state, set up once by the pool initializer
+_worker_index = None
+
+
+def _sample_id(path):
+    name = os.path.basename(path)
+    for ext in (".gz", ".vcf", ".txt", ".csv", ".tsv"):
+        if name.lower().endswith(ext):
+            name = name[:-len(ext)]
+    return name
+
+
+def collect_samples(source):
+    """Return ``(sample_id, path)`` pairs from a directory or a manifest file.
+
+    A manifest lists one sample per line, either as a bare path or as
+    ``sample_id,path`` (comma or tab separated). Relative paths are resolved
+    against the manifest's directory. Raises ValueError when two samples share
+    an ID, such as ``a.txt`` and ``a.vcf`` in one directory.
+    """
+    if os.path.isdir(source):
+        return _check_unique([
+            (_sample_id(name), os.path.join(source, name))
+            for name in sorted(os.listdir(source))
+            if name.lower().endswith(SAMPLE_EXTENSIONS) and os.path.isfile(os.path.join(source, name))
+        ])
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    samples = []
+    with open(source, newline="") as f:
+        dialect = "excel-tab" if "\t" in f.readline() else "excel"
+        f.seek(0)
+        for row in csv.reader(f, dialect):
+            row = [cell.strip() for cell in row]
+            if not row or not row[0] or row[0].startswith("#"):
+                continue
+            if len(row) == 1:
+                sample_id, path = _sample_id(row[0]), row[0]
+            else:
+                sample_id, path = row[0], row[1]
+            if sample_id.lower() == "sample_id":
+                continue # header row
+            samples.append((sample_id, os.path.join(base_dir, path)))
+    return _check_unique(samples)
+
+
+def _check_unique(samples):
+    # IDs name the output files, so two samples with one ID (in any case) would overwrite each other's report
+    paths = {}
+    for sample_id, path in samples:
+        paths.setdefault(sample_id.lower(), []).append((sample_id, path))
+    duplicates = [group for group in paths.values() if len(group) > 1]
+    if duplicates:
+        raise ValueError("duplicate sample IDs; rename the files or list distinct IDs in a manifest: " + "; ".join(
+            f"{group[0][0]} ({', '.join(path for _, path in group)})" for group in duplicates
+        ))
+    return samples
+
+
+def _init_worker():
+    global _worker_index
+    _worker_index = build_default_index()
+    warm_chart_cache()
+
+
+def process_sample(task):
+    # Runs in a worker process. Failures are returned rather than raised so one
+    # bad sample never takes down the rest of the batch.
+    sample_id, path, output_dir, chart_mode = task
+    started = time.perf_counter()
+    try:
+        with track_request("batch_sample", sample=sample_id):
+            list_of_data_dicts = analyze_genotype_file(_worker_index, path)
+            # Written straight to the output file, with no in-memory copy of the report
+            build_report(list_of_data_dicts, chart_mode, os.path.join(output_dir, f"nutrigene_report_{sample_id}.pdf"))
+        return sample_id, True, len(list_of_data_dicts), time.perf_counter() - started, None
+    except Exception as e:
+        return sample_id, False, 0, time.perf_counter() - started, f"{type(e).__name__}: {e}"
+
+
+def run_batch(samples, output_dir, workers=None, chunksize=8, chart_mode=None):
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(sample_id, path, output_dir, chart_mode) for sample_id, path in samples]
+    results = []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for result in pool.map(process_sample, tasks, chunksize=chunksize):
+            results.append(result)
+            sample_id, ok, _, _, error = result
+            if not ok:
+                print(f"FAILED {sample_id}: {error}", file=sys.stderr)
+    elapsed = time.perf_counter() - started
+    return results, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate NutriGene PDF reports for many samples.")
+    parser.add_argument("source", help="Directory of genotype files, or a manifest listing them")
+    parser.add_argument("-o", "--output-dir", default="reports", help="Where to write the PDF reports")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--chunksize", type=int, default=8, help="Samples handed to a worker at a time")
+    parser.add_argument("--chart-mode", choices=CHART_MODES, default=None,
+                        help="Embed risk charts as cached PNGs (raster) or draw them natively (vector)")
+    args = parser.parse_args(argv)
+
+    try:
+        samples = collect_samples(args.source)
+    except ValueError as e:
+        print(f"{args.source}: {e}", file=sys.stderr)
+        return 1
+    if not samples:
+        print(f"No samples found in {args.source}", file=sys.stderr)
+        return 1
+
+    results, elapsed = run_batch(samples, args.output_dir, args.workers, args.chunksize, args.chart_mode)
+    failed = sum(1 for _, ok, _, _, _ in results if not ok)
+    throughput = len(results) / elapsed if elapsed > 0 else float("inf")
+    print(f"Processed {len(results)} samples ({failed} failed) in {elapsed:.2f}s "
+          f"with {args.workers} workers: {throughput:.1f} samples/s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
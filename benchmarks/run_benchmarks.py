@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.synthetic_data import generate_knowledge_base, write_cohort_matrix, write_raw_genotype_file
+from cohort import CohortLayout, analyze_cohort
+from genotype_parser import iter_matched_records
+from nutrigene_core import build_chart_buffers, generate_pdf_report
+from risk_chart import CHART_MODE_VECTOR, RISK_LEVELS, render_risk_chart, save_risk_chart, warm_chart_cache
+from snp_index import SNPIndex
+from snp_kb import CompactSNPIndex, compile_knowledge_base
+from snp_search import PrefixSearchIndex
+
+DEFAULT_SIZES = (100, 10_000, 1_000_000)
+REPORT_SIZES = (1, 10, 100)
+# Cohort benchmark: samples x the SNPs of a knowledge base of COHORT_KB_RECORDS records
+COHORT_SAMPLES = 100_000
+COHORT_KB_RECORDS = 3_000
+
+
+def measure(fn, repeat=5, number=1):
+    """Time ``fn`` and return per-call statistics in milliseconds."""
+    fn() # warm-up
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - started) * 1000 / number)
+    samples.sort()
+    return {
+        "mean_ms": statistics.fmean(samples),
+        "median_ms": statistics.median(samples),
+        "min_ms": samples[0],
+        "max_ms": samples[-1],
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def bench_lookup(knowledge_base, workdir, n_queries=10_000, seed=0):
+    rng = random.Random(seed)
+    rsids = [r['SNP'] for r in rng.choices(knowledge_base, k=n_queries)]
+    misses = [f"rs{1_900_000_000 + i}" for i in range(n_queries)]
+    results = {}
+
+    started = time.perf_counter()
+    index = SNPIndex(knowledge_base)
+    results["snp_index_build_ms"] = (time.perf_counter() - started) * 1000
+
+    kb_path = os.path.join(workdir, f"kb_{len(knowledge_base)}.sqlite")
+    started = time.perf_counter()
+    compile_knowledge_base(knowledge_base, kb_path)
+    results["compact_compile_ms"] = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    compact = CompactSNPIndex(kb_path)
+    results["compact_load_ms"] = (time.perf_counter() - started) * 1000
+
+    for name, idx in (("snp_index", index), ("compact", compact)):
+        results[f"{name}_lookup_hit"] = measure(lambda: [idx.lookup(r) for r in rsids], repeat=3)
+        results[f"{name}_lookup_miss"] = measure(lambda: [idx.lookup(r) for r in misses], repeat=3)
+        for key in (f"{name}_lookup_hit", f"{name}_lookup_miss"):
+            results[key]["per_query_us"] = results[key]["median_ms"] * 1000 / n_queries
+    return index, results
+
+
+def bench_search(knowledge_base, n_queries=1_000, seed=0):
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    index = PrefixSearchIndex(knowledge_base)
+    results = {"build_ms": (time.perf_counter() - started) * 1000}
+    # Every keystroke of an rsID, gene name or nutrient, as typed into the search box
+    values = [r[rng.choice(("SNP", "Gene Name", "Nutrient"))] for r in rng.choices(knowledge_base, k=n_queries // 5)]
+    queries = [value[:n] for value in values for n in range(1, 6)]
+    results["search"] = measure(lambda: [index.search(q) for q in queries], repeat=3)
+    results["search"]["per_query_us"] = results["search"]["median_ms"] * 1000 / len(queries)
+    return results
+
+
+def bench_charts():
+    warm_chart_cache()
+    return {
+        "render_uncached": measure(lambda: render_risk_chart("High"), repeat=5),
+        "save_risk_chart_cached": measure(lambda: [save_risk_chart(r) for r in RISK_LEVELS], repeat=5, number=100),
+    }
+
+
+def bench_reports(knowledge_base):
+    results = {}
+    for n in REPORT_SIZES:
+        records = knowledge_base[:n]
+        charts = build_chart_buffers(records)
+        stats = measure(lambda: generate_pdf_report(records, charts), repeat=3)
+        stats["pdf_bytes"] = len(generate_pdf_report(records, charts).getvalue())
+        results[f"generate_pdf_report_{n}"] = stats
+        stats = measure(lambda: generate_pdf_report(records, [], CHART_MODE_VECTOR), repeat=3)
+        stats["pdf_bytes"] = len(generate_pdf_report(records, [], CHART_MODE_VECTOR).getvalue())
+        results[f"generate_pdf_report_vector_{n}"] = stats
+    return results
+
+
+def bench_end_to_end(index, knowledge_base, workdir, n_rows):
+    path = os.path.join(workdir, f"sample_{len(knowledge_base)}.txt")
+    hits = write_raw_genotype_file(path, knowledge_base, n_rows=n_rows, hit_fraction=20 / n_rows)
+
+    def run():
+        records = list(iter_matched_records(path, index))
+        generate_pdf_report(records, build_chart_buffers(records))
+
+    stats = measure(run, repeat=3)
+    parse_stats = measure(lambda: sum(1 for _ in iter_matched_records(path, index)), repeat=3)
+    return {"file_rows": n_rows, "kb_rows_in_file": hits, "end_to_end": stats, "parse_only": parse_stats}
+
+
+def bench_cohort(workdir, n_samples=COHORT_SAMPLES, n_records=COHORT_KB_RECORDS):
+    layout = CohortLayout.from_index(SNPIndex(generate_knowledge_base(n_records)))
+    cohort = write_cohort_matrix(os.path.join(workdir, "cohort"), layout, n_samples)
+    stats = measure(lambda: analyze_cohort(cohort), repeat=3)
+    return {"samples": n_samples, "snps": len(layout.rsids), "matrix_bytes": cohort.matrix.nbytes, "analyze": stats}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, genotype_rows):
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "sizes": list(sizes),
+        },
+        "charts": bench_charts(),
+        "knowledge_base": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="nutrigene-bench-") as workdir:
+        for size in sizes:
+            knowledge_base = generate_knowledge_base(size)
+            index, lookup = bench_lookup(knowledge_base, workdir)
+            entry = {"lookup": lookup, "search": bench_search(knowledge_base), "end_to_end": bench_end_to_end(index, knowledge_base, workdir, genotype_rows)}
+            if size >= max(REPORT_SIZES):
+                entry["reports"] = bench_reports(knowledge_base)
+            results["knowledge_base"][str(size)] = entry
+            print(f"kb={size}: done", file=sys.stderr)
+        results["cohort"] = bench_cohort(workdir)
+    return results
+
+
+def _flatten(results, prefix=""):
+    for key, value in results.items():
+        if key == "meta":
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            if "median_ms" in value:
+                yield name, value["median_ms"]
+            else:
+                yield from _flatten(value, f"{name}.")
+
+
+def compare(current, baseline, threshold):
+    """Return ``(metric, baseline_ms, current_ms, ratio)`` for timings that regressed past ``threshold``."""
+    base = dict(_flatten(baseline))
+    regressions = []
+    for name, value in _flatten(current):
+        if name in base and base[name] > 0:
+            ratio = value / base[name]
+            if ratio > threshold:
+                regressions.append((name, base[name], value, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the NutriGene performance benchmarks.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="Knowledge-base sizes (records) to benchmark")
+    parser.add_argument("--genotype-rows", type=int, default=600_000, help="Rows in the synthetic raw genotype file")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Baseline results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown ratio counted as a regression")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.genotype_rows)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after, ratio in regressions:
+            print(f"REGRESSION {name}: {before:.3f} ms -> {after:.3f} ms ({ratio:.2f}x)", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
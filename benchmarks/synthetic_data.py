@@ -0,0 +1,104 @@
+import random
+
+from snp_data import snp_data
+
+# Genotypes drawn for synthetic variants, as (genotype, risk level) per allele pair
+_ALLELE_PAIRS = (("A", "G"), ("C", "T"), ("A", "C"), ("G", "T"), ("A", "T"), ("C", "G"))
+_RISK_BY_DOSAGE = ("Low", "Medium", "High")
+
+# Keys taken verbatim from snp_data so the text pools repeat the way curated entries do
+_TEXT_KEYS = ("Gene Name", "Effect", "Nutrient", "Recommendation", "Local Food Recommendations (Pakistani)")
+
+
+def _text_pools():
+    # The built-in report fonts are latin-1 only, so keep the pools to what they can render
+    pools = {}
+    for key in _TEXT_KEYS:
+        values = sorted({r[key] for r in snp_data if _latin1(r[key])})
+        pools[key] = values
+    return pools
+
+
+def _latin1(text):
+    try:
+        text.encode("latin-1")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def generate_knowledge_base(n_records, seed=0, genotypes_per_snp=3):
+    """Return ``n_records`` knowledge-base dicts shaped like ``snp_data``.
+
+    Each synthetic rsID gets up to ``genotypes_per_snp`` genotypes (hom-ref,
+    het, hom-alt) with Low/Medium/High risk, and the free-text fields are
+    sampled from the curated entries.
+    """
+    rng = random.Random(seed)
+    pools = _text_pools()
+    records = []
+    rsid_number = 10_000_000
+    while len(records) < n_records:
+        rsid_number += rng.randint(1, 50)
+        ref, alt = rng.choice(_ALLELE_PAIRS)
+        texts = {key: rng.choice(pools[key]) for key in _TEXT_KEYS}
+        for dosage, genotype in enumerate((ref + ref, ref + alt, alt + alt)[:genotypes_per_snp]):
+            if len(records) == n_records:
+                break
+            records.append({
+                'SNP': f"rs{rsid_number}",
+                'Gene Name': texts["Gene Name"],
+                'Genotype': genotype,
+                'Effect': texts["Effect"],
+                'Nutrient': texts["Nutrient"],
+                'Recommendation': texts["Recommendation"],
+                'Local Food Recommendations (Pakistani)': texts["Local Food Recommendations (Pakistani)"],
+                'Risk Level': _RISK_BY_DOSAGE[dosage],
+            })
+    return records
+
+
+def write_cohort_matrix(base_path, layout, n_samples, missing_fraction=0.05, seed=0, chunk_rows=20_000):
+    """Write a cohort of ``n_samples`` random samples over ``layout`` (a ``cohort.CohortLayout``).
+
+    Each call is one of the SNP's known genotypes, or missing with probability
+    ``missing_fraction``. Returns the ``cohort.Cohort``.
+    """
+    import numpy as np
+
+    from cohort import FIRST_KNOWN, NO_CALL, Cohort
+
+    rng = np.random.default_rng(seed)
+    known = np.array([len(g) for g in layout.genotypes], dtype=np.int8)
+    matrix = Cohort.create(base_path, layout, [f"sample{i}" for i in range(n_samples)])
+    for start in range(0, n_samples, chunk_rows):
+        rows = min(chunk_rows, n_samples - start)
+        codes = (rng.random((rows, len(known))) * known).astype(np.int8) + FIRST_KNOWN
+        codes[rng.random((rows, len(known))) < missing_fraction] = NO_CALL
+        matrix[start:start + rows] = codes
+    matrix.flush()
+    del matrix
+    return Cohort(base_path)
+
+
+def write_raw_genotype_file(path, knowledge_base, n_rows=600_000, hit_fraction=0.01, seed=0):
+    """Write a 23andMe-style raw genotype file of ``n_rows`` calls.
+
+    About ``hit_fraction`` of the rows are rsIDs from ``knowledge_base``
+    (called with one of its genotypes); the rest are rsIDs it does not contain.
+    Returns the number of knowledge-base rows written.
+    """
+    rng = random.Random(seed)
+    kb_calls = [(r['SNP'], r['Genotype']) for r in knowledge_base]
+    hits = 0
+    with open(path, "w", newline="\n") as f:
+        f.write("# This data file generated by NutriGene benchmarks\n")
+        f.write("# rsid\tchromosome\tposition\tgenotype\n")
+        for row in range(n_rows):
+            if kb_calls and rng.random() < hit_fraction:
+                rsid, genotype = rng.choice(kb_calls)
+                hits += 1
+            else:
+                rsid, genotype = f"rs{900_000_000 + row}", rng.choice(("AA", "AG", "GG", "CT", "--"))
+            f.write(f"{rsid}\t{rng.randint(1, 22)}\t{row * 100 + 1}\t{genotype}\n")
+    return hits
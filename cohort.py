@@ -0,0 +1,362 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from genotype_parser import iter_genotype_calls
+from instrumentation import span, track_request
+from risk_chart import CHART_MODES
+from snp_index import build_default_index, normalize_genotype
+
+# What each call counts as, by index: missing, called with a genotype the knowledge
+# base has no risk level for, or the risk level of the matching entry
+CALL_CATEGORIES = ("No call", "Not in KB", "Low", "Medium", "High")
+CATEGORY_INDEX = {name: i for i, name in enumerate(CALL_CATEGORIES)}
+# Genotype codes stored per call; a SNP's known genotypes are numbered from FIRST_KNOWN
+NO_CALL = 0
+NOT_IN_KB = 1
+FIRST_KNOWN = 2
+# Version of the stored codes; cohorts written with an older numbering must be rebuilt
+COHORT_FORMAT = 2
+
+# Working memory for one slice of the memory-mapped matrix; the samples per slice follow from the SNP count
+DEFAULT_CHUNK_BYTES = int(float(os.environ.get("NUTRIGENE_COHORT_CHUNK_MB", 64)) * (1 << 20))
+# Bytes held per call of a slice while it is analysed: the mapped codes, risk levels, High nutrients and masks
+BYTES_PER_CALL = 8
+
+
+class CohortLayout:
+    """Columns of a cohort matrix: the knowledge-base SNPs and their genotype codes.
+
+    Each SNP's known genotypes are numbered from ``FIRST_KNOWN``; ``NO_CALL`` is a
+    missing call and ``NOT_IN_KB`` a call with a genotype the knowledge base has no
+    entry for. A sample is one int8 per SNP. ``risk_table`` and ``nutrient_table``
+    map ``[column, code]`` to the ``CALL_CATEGORIES`` index and nutrient of that call;
+    ``high_nutrient_table`` holds the nutrient index + 1 of High-risk calls, else 0.
+    """
+
+    def __init__(self, rsids, genotypes, risk_levels, nutrients, genes, kb_fingerprint=None):
+        self.rsids = list(rsids)
+        self.genotypes = [list(g) for g in genotypes]
+        self.risk_levels = [list(r) for r in risk_levels]
+        self.nutrients = [list(n) for n in nutrients]
+        self.genes = list(genes)
+        self.kb_fingerprint = kb_fingerprint
+        self.columns = {rsid: j for j, rsid in enumerate(self.rsids)}
+        self._codes = [{genotype: code for code, genotype in enumerate(g, FIRST_KNOWN)} for g in self.genotypes]
+
+        n_codes = max((len(g) for g in self.genotypes), default=0) + FIRST_KNOWN
+        if n_codes > np.iinfo(np.int8).max:
+            raise ValueError("too many genotypes per SNP for an int8 cohort matrix")
+        self.nutrient_names = sorted({n for group in self.nutrients for n in group})
+        nutrient_ids = {name: i for i, name in enumerate(self.nutrient_names)}
+        self.risk_table = np.zeros((len(self.rsids), n_codes), dtype=np.int8)
+        self.nutrient_table = np.zeros((len(self.rsids), n_codes), dtype=np.int16)
+        not_in_kb = CATEGORY_INDEX["Not in KB"]
+        for j, (levels, names) in enumerate(zip(self.risk_levels, self.nutrients)):
+            # Calls without a known genotype are counted under the SNP's first nutrient
+            self.nutrient_table[j, :FIRST_KNOWN] = nutrient_ids[names[0]] if names else 0
+            self.risk_table[j, NOT_IN_KB] = not_in_kb
+            for code, (level, name) in enumerate(zip(levels, names), FIRST_KNOWN):
+                # A listed genotype without a Low/Medium/High risk level has no rating either
+                self.risk_table[j, code] = CATEGORY_INDEX.get(level, not_in_kb)
+                self.nutrient_table[j, code] = nutrient_ids[name]
+        high = self.risk_table == CATEGORY_INDEX["High"]
+        self.high_nutrient_table = np.where(high, self.nutrient_table + 1, 0).astype(np.int16)
+
+    @classmethod
+    def from_index(cls, snp_index):
+        rsids, genotypes, risk_levels, nutrients, genes = sorted(snp_index.rsids()), [], [], [], []
+        for rsid in rsids:
+            seen = {}
+            for record in snp_index.lookup(rsid):
+                # The first record for a genotype decides its risk, as in a single-SNP lookup
+                seen.setdefault(normalize_genotype(record.get("Genotype", "")), record)
+            genotypes.append(list(seen))
+            risk_levels.append([r.get("Risk Level", "UNKNOWN") for r in seen.values()])
+            nutrients.append([str(r.get("Nutrient", "")) for r in seen.values()])
+            genes.append(next(iter(seen.values()), {}).get("Gene Name", ""))
+        return cls(rsids, genotypes, risk_levels, nutrients, genes, snp_index.fingerprint())
+
+    def to_dict(self):
+        return {
+            "rsids": self.rsids, "genotypes": self.genotypes, "risk_levels": self.risk_levels,
+            "nutrients": self.nutrients, "genes": self.genes, "kb_fingerprint": self.kb_fingerprint,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["rsids"], data["genotypes"], data["risk_levels"], data["nutrients"], data["genes"],
+                   data.get("kb_fingerprint"))
+
+    def encode(self, calls):
+        """One int8 row of genotype codes from ``(rsid, genotype)`` calls."""
+        row = np.zeros(len(self.rsids), dtype=np.int8)
+        for rsid, genotype in calls:
+            j = self.columns.get(rsid)
+            if j is not None:
+                row[j] = self._codes[j].get(normalize_genotype(genotype), NOT_IN_KB)
+        return row
+
+
+class Cohort:
+    """A cohort stored as ``<base>.npy`` (samples x SNPs int8 codes) plus ``<base>.json`` (samples and layout).
+
+    The matrix is memory-mapped, so only the slices being analysed are read.
+    ``failed`` lists the samples whose files could not be read; their rows are all no-calls.
+    """
+
+    def __init__(self, base_path):
+        with open(base_path + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != COHORT_FORMAT:
+            raise ValueError(f"{base_path} was encoded by an older version of cohort.py; rebuild it")
+        self.base_path = base_path
+        self.samples = meta["samples"]
+        self.failed = meta.get("failed", [])
+        self.layout = CohortLayout.from_dict(meta["layout"])
+        self.matrix = np.load(base_path + ".npy", mmap_mode="r")
+
+    def __len__(self):
+        return len(self.samples)
+
+    @staticmethod
+    def write_sidecar(base_path, layout, sample_ids, failed=()):
+        with open(base_path + ".json", "w", encoding="utf-8") as f:
+            json.dump({"format": COHORT_FORMAT, "samples": list(sample_ids), "failed": list(failed),
+                       "layout": layout.to_dict()}, f)
+
+    @staticmethod
+    def create(base_path, layout, sample_ids):
+        """Write the sidecar and return a zeroed, writable memory-mapped matrix for ``sample_ids``."""
+        Cohort.write_sidecar(base_path, layout, sample_ids)
+        return np.lib.format.open_memmap(
+            base_path + ".npy", mode="w+", dtype=np.int8, shape=(len(sample_ids), len(layout.rsids))
+        )
+
+
+class CohortSummary:
+    """Call counts for a cohort, indexed like ``CALL_CATEGORIES``."""
+
+    def __init__(self, cohort, per_sample, per_snp, per_nutrient, nutrient_high_samples):
+        self.samples = cohort.samples
+        self.failed = cohort.failed
+        self.layout = cohort.layout
+        self.per_sample = per_sample
+        self.per_snp = per_snp
+        self.per_nutrient = per_nutrient
+        self.nutrient_high_samples = nutrient_high_samples
+
+    def risk_counts(self):
+        totals = self.per_snp.sum(axis=0)
+        return {category: int(count) for category, count in zip(CALL_CATEGORIES, totals)}
+
+    def _shares(self, counts):
+        total = max(int(counts.sum()), 1)
+        return {category: int(count) / total for category, count in zip(CALL_CATEGORIES, counts)}
+
+    def snp_rows(self, limit=None):
+        """Per-SNP shares of each call category, most often High first."""
+        order = np.lexsort((-self.per_snp[:, CATEGORY_INDEX["Medium"]], -self.per_snp[:, CATEGORY_INDEX["High"]]))
+        rows = []
+        for j in order[:limit].tolist():
+            rows.append({"SNP": self.layout.rsids[j], "Gene Name": self.layout.genes[j], **self._shares(self.per_snp[j])})
+        return rows
+
+    def nutrient_rows(self):
+        rows = []
+        for i, name in enumerate(self.layout.nutrient_names):
+            rows.append({"Nutrient": name, **self._shares(self.per_nutrient[i]),
+                         "Samples with High": int(self.nutrient_high_samples[i])})
+        return rows
+
+    def high_count_distribution(self, max_bins=10):
+        """``(label, samples)`` pairs: how many samples carry 0, 1, 2, ... High-risk genotypes."""
+        counts = np.bincount(self.per_sample[:, CATEGORY_INDEX["High"]], minlength=max_bins)
+        rows = [(str(n), int(c)) for n, c in enumerate(counts[:max_bins - 1])]
+        rows.append((f"{max_bins - 1}+", int(counts[max_bins - 1:].sum())))
+        return rows
+
+    def write_csvs(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "per_sample.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["sample_id", *CALL_CATEGORIES])
+            for sample_id, counts in zip(self.samples, self.per_sample.tolist()):
+                writer.writerow([sample_id, *counts])
+        with open(os.path.join(directory, "per_snp.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["SNP", "Gene Name", *CALL_CATEGORIES])
+            for rsid, gene, counts in zip(self.layout.rsids, self.layout.genes, self.per_snp.tolist()):
+                writer.writerow([rsid, gene, *counts])
+        with open(os.path.join(directory, "per_nutrient.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Nutrient", *CALL_CATEGORIES, "samples_with_high"])
+            for name, counts, high in zip(self.layout.nutrient_names, self.per_nutrient.tolist(),
+                                          self.nutrient_high_samples.tolist()):
+                writer.writerow([name, *counts, high])
+
+
+def default_chunk_rows(n_snps, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Samples per slice so that analysing one stays within ``chunk_bytes``."""
+    return max(1, chunk_bytes // (max(n_snps, 1) * BYTES_PER_CALL))
+
+
+def analyze_cohort(cohort, chunk_rows=None):
+    """Per-sample, per-SNP and per-nutrient call counts, ``chunk_rows`` samples at a time.
+
+    ``chunk_rows`` defaults to what fits in ``DEFAULT_CHUNK_BYTES``. Per-SNP and
+    per-nutrient counts only need how often each (SNP, genotype) pair occurs, so
+    each slice adds to those counts and the risk and nutrient tables are applied
+    once at the end. For per-sample counts the slice is mapped through the tables
+    one genotype code at a time, into buffers reused across slices, so no index
+    array is built.
+    """
+    layout = cohort.layout
+    n_levels = len(CALL_CATEGORIES)
+    n_samples, n_snps = cohort.matrix.shape
+    n_codes = layout.risk_table.shape[1]
+    n_nutrients = max(len(layout.nutrient_names), 1)
+    if chunk_rows is None:
+        chunk_rows = default_chunk_rows(n_snps)
+    high_nutrients = layout.high_nutrient_table
+    # Columns where some genotype is High-risk for each nutrient; hits are only looked for there
+    high_columns = [(n, np.flatnonzero((high_nutrients == n + 1).any(axis=1))) for n in range(n_nutrients)]
+    high_columns = [(n, columns) for n, columns in high_columns if columns.size]
+
+    per_sample = np.zeros((n_samples, n_levels), dtype=np.int32)
+    genotype_counts = np.zeros((n_snps, n_codes), dtype=np.int64)
+    nutrient_high_samples = np.zeros(n_nutrients, dtype=np.int64)
+    with span("cohort_analysis"):
+        shape = (min(chunk_rows, n_samples), n_snps)
+        buffers = (np.empty(shape, dtype=bool), np.empty(shape, dtype=np.int8), np.empty(shape, dtype=np.int8),
+                   np.empty(shape, dtype=np.int16), np.empty(shape, dtype=np.int16))
+        for start in range(0, n_samples, chunk_rows):
+            codes = cohort.matrix[start:start + chunk_rows]
+            rows = len(codes)
+            mask, risk, risk_part, high_nutrient, high_part = (buffer[:rows] for buffer in buffers)
+            risk.fill(0)
+            high_nutrient.fill(0)
+            # Each call has a single code, so adding (call has code) x table column over all codes maps the slice
+            for code in range(n_codes):
+                np.equal(codes, code, out=mask)
+                genotype_counts[:, code] += np.count_nonzero(mask, axis=0)
+                for table, total, part in ((layout.risk_table, risk, risk_part),
+                                           (high_nutrients, high_nutrient, high_part)):
+                    if table[:, code].any():
+                        np.multiply(mask, table[:, code], out=part)
+                        total += part
+            for category in range(1, n_levels):
+                per_sample[start:start + rows, category] = np.count_nonzero(np.equal(risk, category, out=mask), axis=1)
+            # Samples with at least one High-risk genotype touching each nutrient
+            for n, columns in high_columns:
+                nutrient_high_samples[n] += np.count_nonzero((high_nutrient[:, columns] == n + 1).any(axis=1))
+        per_sample[:, CATEGORY_INDEX["No call"]] = n_snps - per_sample.sum(axis=1)
+
+        genotype_counts = genotype_counts.ravel()
+        risk_keys = layout.risk_table.ravel().astype(np.int64)
+        nutrient_flat = layout.nutrient_table.ravel().astype(np.int64)
+        snp_keys = np.repeat(np.arange(n_snps, dtype=np.int64), n_codes)
+        per_snp = np.bincount(snp_keys * n_levels + risk_keys, weights=genotype_counts,
+                              minlength=n_snps * n_levels).astype(np.int64).reshape(n_snps, n_levels)
+        per_nutrient = np.bincount(nutrient_flat * n_levels + risk_keys, weights=genotype_counts,
+                                   minlength=n_nutrients * n_levels).astype(np.int64).reshape(n_nutrients, n_levels)
+    return CohortSummary(cohort, per_sample, per_snp, per_nutrient, nutrient_high_samples)
+
+
+# Per-process state for building a cohort in parallel
+_worker_layout = None
+
+
+def _init_worker(layout_dict):
+    global _worker_layout
+    _worker_layout = CohortLayout.from_dict(layout_dict)
+
+
+def _encode_sample(path):
+    # Failures are returned rather than raised so one unreadable file never aborts the build
+    try:
+        return _worker_layout.encode(iter_genotype_calls(path, _worker_layout.rsids)).tobytes(), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def build_cohort(samples, base_path, snp_index, workers=None, chunksize=16):
+    """Encode ``(sample_id, path)`` genotype files into a cohort matrix at ``base_path``.
+
+    A sample whose file cannot be read is reported on stderr, keeps an all no-call
+    row and is listed in the returned cohort's ``failed``.
+    """
+    layout = CohortLayout.from_index(snp_index)
+    sample_ids = [sample_id for sample_id, _ in samples]
+    matrix = Cohort.create(base_path, layout, sample_ids)
+    paths = [path for _, path in samples]
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(layout.to_dict(),)) as pool:
+        for i, (row, error) in enumerate(pool.map(_encode_sample, paths, chunksize=chunksize)):
+            if error is None:
+                matrix[i] = np.frombuffer(row, dtype=np.int8)
+            else:
+                print(f"FAILED {sample_ids[i]}: {error}", file=sys.stderr)
+                failed.append(sample_ids[i])
+    matrix.flush()
+    del matrix
+    if failed:
+        Cohort.write_sidecar(base_path, layout, sample_ids, failed)
+    return Cohort(base_path)
+
+
+def main(argv=None):
+    # Imported here so `cohort.py build` does not pull in the report stack
+    from batch_report import collect_samples
+
+    parser = argparse.ArgumentParser(description="Build and summarise NutriGene cohort risk matrices.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Encode a directory or manifest of genotype files")
+    build.add_argument("source", help="Directory of genotype files, or a manifest listing them")
+    build.add_argument("-o", "--output", default="cohort", help="Base path of the cohort (.npy and .json)")
+    build.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    report = commands.add_parser("report", help="Summarise a cohort as a PDF report and CSV tables")
+    report.add_argument("cohort", help="Base path of the cohort (.npy and .json)")
+    report.add_argument("-o", "--output", default="nutrigene_cohort_report.pdf", help="Where to write the PDF report")
+    report.add_argument("--csv-dir", help="Also write per-sample, per-SNP and per-nutrient CSV tables here")
+    report.add_argument("--chunk-rows", type=int, default=None,
+                        help="Samples analysed at a time (default: as many as fit in NUTRIGENE_COHORT_CHUNK_MB, 64)")
+    report.add_argument("--chart-mode", choices=CHART_MODES, default=None,
+                        help="Embed risk charts as cached PNGs (raster) or draw them natively (vector)")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.command == "build":
+        try:
+            samples = collect_samples(args.source)
+        except ValueError as e:
+            print(f"{args.source}: {e}", file=sys.stderr)
+            return 1
+        if not samples:
+            print(f"No samples found in {args.source}", file=sys.stderr)
+            return 1
+        cohort = build_cohort(samples, args.output, build_default_index(), args.workers)
+        print(f"Encoded {len(cohort)} samples ({len(cohort.failed)} failed) x {len(cohort.layout.rsids)} SNPs "
+              f"into {args.output}.npy in {time.perf_counter() - started:.2f}s")
+        return 1 if cohort.failed else 0
+
+    from nutrigene_core import generate_cohort_report
+
+    with track_request("cohort_report", cohort=args.cohort):
+        cohort = Cohort(args.cohort)
+        summary = analyze_cohort(cohort, args.chunk_rows)
+        generate_cohort_report(summary, args.chart_mode, args.output)
+        if args.csv_dir:
+            summary.write_csvs(args.csv_dir)
+    print(f"Summarised {len(cohort)} samples in {time.perf_counter() - started:.2f}s: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
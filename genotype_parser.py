@@ -0,0 +1,149 @@
+import gzip
+import os
+
+from snp_index import normalize_rsid
+
+# Raw files are read in fixed-size chunks so memory stays flat whatever the file size
+CHUNK_SIZE = 1 << 20
+
+FORMAT_RAW = "raw"  # 23andMe / AncestryDNA tab-separated exports, or the same columns comma-separated
+FORMAT_VCF = "vcf"
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_NO_CALL_ALLELES = {"-", "0", "I", "D", "N"}
+
+
+def _open_binary(source):
+    # Accepts a path or an already-open binary file object (e.g. a Streamlit UploadedFile)
+    if isinstance(source, (str, bytes, os.PathLike)):
+        raw, owned = open(source, "rb"), True
+    else:
+        raw, owned = source, False
+    start = raw.tell()
+    head = raw.read(2)
+    raw.seek(start)
+    stream = gzip.GzipFile(fileobj=raw, mode="rb") if head == _GZIP_MAGIC else raw
+    return raw, stream, owned
+
+
+def iter_lines(source, chunk_size=CHUNK_SIZE):
+    """Yield the lines of ``source`` as bytes, reading ``chunk_size`` bytes at a time."""
+    raw, stream, owned = _open_binary(source)
+    try:
+        tail = b""
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            yield from lines
+        if tail:
+            yield tail
+    finally:
+        if stream is not raw:
+            stream.close()
+        if owned:
+            raw.close()
+
+
+def _raw_calls(lines, wanted, first_line):
+    for line in _chain_first(first_line, lines):
+        if not line or line[:1] == b"#":
+            continue
+        delimiter = b"\t"
+        rsid, sep, rest = line.partition(delimiter)
+        if not sep:
+            # CSV exports (e.g. MyHeritage) use commas and may quote every field
+            delimiter = b","
+            rsid, sep, rest = line.partition(delimiter)
+            if not sep:
+                continue
+        rsid = rsid.strip().strip(b'"').lower()
+        if rsid not in wanted:
+            continue
+        fields = [field.strip().strip(b'"') for field in rest.rstrip(b"\r").split(delimiter)]
+        if len(fields) >= 4:
+            # AncestryDNA: chromosome, position, allele1, allele2
+            genotype = (fields[2] + fields[3]).decode("ascii", "replace").upper()
+        elif len(fields) == 3:
+            # 23andMe: chromosome, position, genotype
+            genotype = fields[2].decode("ascii", "replace").upper()
+        else:
+            continue
+        if not genotype or any(allele in _NO_CALL_ALLELES for allele in genotype):
+            continue
+        yield rsid.decode("ascii"), genotype
+
+
+def _vcf_calls(lines, wanted, first_line, sample=None):
+    sample_col = 9
+    for line in _chain_first(first_line, lines):
+        if not line:
+            continue
+        if line[:2] == b"##":
+            continue
+        if line[:1] == b"#":
+            header = line.rstrip(b"\r").decode("utf-8", "replace").split("\t")
+            if sample is not None:
+                if sample not in header[9:]:
+                    raise ValueError(f"Sample '{sample}' not found in VCF header")
+                sample_col = header.index(sample, 9)
+            continue
+        fields = line.rstrip(b"\r").split(b"\t")
+        if len(fields) <= sample_col:
+            continue
+        ids = [i for i in fields[2].lower().split(b";") if i in wanted]
+        if not ids:
+            continue
+        format_keys = fields[8].split(b":")
+        if b"GT" not in format_keys:
+            continue
+        sample_values = fields[sample_col].split(b":")
+        gt_pos = format_keys.index(b"GT")
+        if gt_pos >= len(sample_values):
+            continue
+        gt = sample_values[gt_pos].replace(b"|", b"/").split(b"/")
+        if any(g == b"." for g in gt):
+            continue
+        alleles = [fields[3]] + fields[4].split(b",")
+        try:
+            genotype = b"".join(alleles[int(g)] for g in gt).decode("ascii").upper()
+        except (ValueError, IndexError):
+            continue
+        for rsid in ids:
+            yield rsid.decode("ascii"), genotype
+
+
+def _chain_first(first_line, lines):
+    if first_line is not None:
+        yield first_line
+    yield from lines
+
+
+def iter_genotype_calls(source, rsids, file_format=None, sample=None, chunk_size=CHUNK_SIZE):
+    """Stream (rsID, genotype) calls from a raw genotype file or VCF.
+
+    Only rows whose rsID is in ``rsids`` are parsed beyond their first column.
+    The format is detected from the first line when ``file_format`` is not given.
+    """
+    wanted = {normalize_rsid(r).encode("ascii") for r in rsids}
+    lines = iter_lines(source, chunk_size)
+    first_line = next(lines, None)
+    if first_line is None:
+        return
+    if file_format is None:
+        file_format = FORMAT_VCF if first_line.startswith(b"##fileformat=VCF") else FORMAT_RAW
+    if file_format == FORMAT_VCF:
+        yield from _vcf_calls(lines, wanted, first_line, sample)
+    elif file_format == FORMAT_RAW:
+        yield from _raw_calls(lines, wanted, first_line)
+    else:
+        raise ValueError(f"Unsupported genotype file format: {file_format}")
+
+
+def iter_matched_records(source, snp_index, file_format=None, sample=None, chunk_size=CHUNK_SIZE):
+    """Yield knowledge-base records matching the (SNP, Genotype) calls in ``source``."""
+    calls = iter_genotype_calls(source, snp_index.rsids(), file_format, sample, chunk_size)
+    for rsid, genotype in calls:
+        yield from snp_index.lookup_genotype(rsid, genotype)
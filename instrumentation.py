@@ -0,0 +1,138 @@
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+# Logging is off unless NUTRIGENE_LOG_LEVEL (e.g. DEBUG, INFO) asks for it
+logger = logging.getLogger("nutrigene")
+logger.addHandler(logging.NullHandler())
+if os.environ.get("NUTRIGENE_LOG_LEVEL"):
+    logger.setLevel(os.environ["NUTRIGENE_LOG_LEVEL"].upper())
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+    logger.addHandler(_handler)
+    logger.propagate = False
+
+# Time-budget overruns are reported on stderr even with logging off, so a slow replica gets noticed
+budget_logger = logging.getLogger("nutrigene.budget")
+if not os.environ.get("NUTRIGENE_LOG_LEVEL"):
+    _budget_handler = logging.StreamHandler()
+    _budget_handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+    budget_logger.addHandler(_budget_handler)
+    budget_logger.setLevel(logging.WARNING)
+    budget_logger.propagate = False
+
+# Where finished request metrics go: a JSON-lines file and/or an HTTP endpoint (POSTed as JSON)
+METRICS_FILE = os.environ.get("NUTRIGENE_METRICS_FILE")
+METRICS_URL = os.environ.get("NUTRIGENE_METRICS_URL")
+
+_current_request = contextvars.ContextVar("nutrigene_request", default=None)
+_file_lock = threading.Lock()
+
+
+class RequestMetrics:
+    """Stage timings (ms) and counters collected for one request."""
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+        self.spans = {}
+        self.counters = {}
+        self.started = time.perf_counter()
+        self.total_ms = None
+
+    def add_span(self, stage, elapsed_ms):
+        self.spans[stage] = self.spans.get(stage, 0.0) + elapsed_ms
+
+    def incr(self, counter, amount=1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def as_dict(self):
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "request": self.name,
+            "labels": self.labels,
+            "total_ms": self.total_ms,
+            "spans_ms": self.spans,
+            "counters": self.counters,
+        }
+
+
+def current_request():
+    return _current_request.get()
+
+
+@contextlib.contextmanager
+def track_request(name, **labels):
+    """Collect the spans and counters recorded inside the block, then export them."""
+    metrics = RequestMetrics(name, **labels)
+    token = _current_request.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_request.reset(token)
+        metrics.total_ms = (time.perf_counter() - metrics.started) * 1000
+        logger.info("%s %s: %.1f ms spans=%s counters=%s",
+                    name, labels, metrics.total_ms, metrics.spans, metrics.counters)
+        export_metrics(metrics)
+
+
+@contextlib.contextmanager
+def span(stage):
+    """Time a stage and add it to the current request, if any."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(stage, (time.perf_counter() - started) * 1000)
+
+
+def add_span(stage, elapsed_ms):
+    # For stages too long to wrap in a ``with span(...)`` block
+    metrics = _current_request.get()
+    if metrics is not None:
+        metrics.add_span(stage, elapsed_ms)
+    logger.debug("stage %s took %.2f ms", stage, elapsed_ms)
+
+
+def incr(counter, amount=1):
+    metrics = _current_request.get()
+    if metrics is not None:
+        metrics.incr(counter, amount)
+
+
+def record_budget(phase, elapsed_ms, budget_ms):
+    """Export a timed phase (e.g. an app rerun) against its budget, and warn when it overran."""
+    over_budget = elapsed_ms > budget_ms
+    metrics = RequestMetrics(phase, budget_ms=budget_ms, over_budget=over_budget)
+    metrics.total_ms = elapsed_ms
+    export_metrics(metrics)
+    if over_budget:
+        budget_logger.warning("%s took %.1f ms (budget %.0f ms)", phase, elapsed_ms, budget_ms)
+    else:
+        budget_logger.debug("%s took %.1f ms (budget %.0f ms)", phase, elapsed_ms, budget_ms)
+
+
+def _post_metrics(url, payload):
+    try:
+        request = urllib.request.Request(url, data=payload, headers={"Content-Type": "application/json"})
+        urllib.request.urlopen(request, timeout=2).close()
+    except OSError as e:
+        logger.warning("Could not export metrics to %s: %s", url, e)
+
+
+def export_metrics(metrics):
+    if not (METRICS_FILE or METRICS_URL):
+        return
+    payload = json.dumps(metrics.as_dict())
+    if METRICS_FILE:
+        with _file_lock, open(METRICS_FILE, "a", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    if METRICS_URL:
+        # Never let a slow collector hold up the request
+        threading.Thread(target=_post_metrics, args=(METRICS_URL, payload.encode("utf-8")), daemon=True).start()
@@ -0,0 +1,331 @@
+import argparse
+import ast
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from instrumentation import logger
+from snp_index import SNPIndex, row_key
+from snp_kb import DEFAULT_KB_PATH, CompactSNPIndex, compiled_source_digest
+
+DEFAULT_SOURCE = os.environ.get(
+    "NUTRIGENE_KB_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "snp_data.py")
+)
+DEFAULT_POLL_INTERVAL = float(os.environ.get("NUTRIGENE_KB_POLL_SECONDS", 2))
+
+# Rows dropped (by row key) and records added; a changed row appears in both
+KBChange = namedtuple("KBChange", ["removed_keys", "added_records"])
+
+# snp_data.py as it is written: this line, then one record dict per line, then "]"
+_PYTHON_HEADER = re.compile(rb"^snp_data\s*=\s*\[$")
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_format(path):
+    path = path.lower()
+    return "jsonl" if path.endswith(".jsonl") else "json" if path.endswith(".json") else "py"
+
+
+def parse_python_source(data, name="snp_data"):
+    # snp_data.py is read as data, never imported, so an edited file cannot run code
+    for node in ast.parse(data).body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == name for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise ValueError(f"no '{name} = [...]' assignment found")
+
+
+def _check_python_layout(data):
+    stripped = data.strip()
+    first, last = stripped.split(b"\n", 1)[0].strip(), stripped.rsplit(b"\n", 1)[-1].strip()
+    if not _PYTHON_HEADER.match(first) or last != b"]":
+        raise ValueError("not laid out as one record per line")
+
+
+def _parse_python_line(line):
+    text = line.strip()
+    if not text or text[:1] == b"#" or text == b"]" or _PYTHON_HEADER.match(text):
+        return None
+    record = ast.literal_eval(text.rstrip(b",").decode("utf-8"))
+    if not isinstance(record, dict):
+        raise ValueError(f"expected one record dict per line, got {type(record).__name__}")
+    return record
+
+
+def _parse_json_line(line):
+    if not line.strip():
+        return None
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError(f"expected a JSON object per line, got {type(record).__name__}")
+    return record
+
+
+# Formats that can be diffed line by line
+_LINE_PARSERS = {"jsonl": _parse_json_line, "py": _parse_python_line}
+
+
+def _line_set(data):
+    # Distinct lines in file order; blank ones are skipped when parsed
+    return dict.fromkeys(data.splitlines())
+
+
+def _parse_lines(parse, lines):
+    records = []
+    for line in lines:
+        record = parse(line)
+        if record is not None:
+            records.append(record)
+    return records
+
+
+def parse_source(path, data):
+    """Records in the content of a knowledge-base file: ``.py`` (the ``snp_data`` literal), ``.json`` or ``.jsonl``."""
+    file_format = _file_format(path)
+    if file_format == "json":
+        records = json.loads(data)
+    elif file_format == "jsonl":
+        records = _parse_lines(_parse_json_line, _line_set(data))
+    else:
+        try:
+            _check_python_layout(data)
+            records = _parse_lines(_parse_python_line, _line_set(data))
+        except (ValueError, SyntaxError):
+            # Any other layout is parsed whole: slower, and far more memory for a large file
+            records = parse_python_source(data)
+    _group_rows(records) # validates the shape
+    return records
+
+
+def load_source(path=DEFAULT_SOURCE):
+    """Return the records in ``path`` and the file's sha256 digest."""
+    with open(path, "rb") as f:
+        data = f.read()
+    return parse_source(path, data), hashlib.sha256(data).hexdigest()
+
+
+def load_index(path=DEFAULT_SOURCE, data=None):
+    """The knowledge base in ``path`` as an index, fingerprinted by the file's sha256.
+
+    The app, the API and the batch tools all load through here. When the compiled
+    knowledge base (``snp_kb.py``) was compiled from this exact content it is used
+    instead of parsing the file, for the faster start and smaller footprint.
+    """
+    if data is None:
+        with open(path, "rb") as f:
+            data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if compiled_source_digest(DEFAULT_KB_PATH) == digest:
+        return CompactSNPIndex(DEFAULT_KB_PATH)
+    return SNPIndex(parse_source(path, data), digest)
+
+
+def _group_rows(records):
+    rows = {}
+    for record in records:
+        if not isinstance(record, dict):
+            raise ValueError(f"expected a dict per knowledge-base row, got {type(record).__name__}")
+        rows.setdefault(row_key(record), []).append(record)
+    return rows
+
+
+def diff_rows(old_rows, new_rows):
+    """The ``KBChange`` turning ``old_rows`` into ``new_rows`` (both ``{row key: [records]}``)."""
+    removed = [key for key, group in old_rows.items() if new_rows.get(key) != group]
+    added = [record for key, group in new_rows.items() if old_rows.get(key) != group for record in group]
+    return KBChange(removed, added)
+
+
+def write_jsonl(records, path):
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class KnowledgeBaseWatcher:
+    """Knowledge base loaded from a data file and reloaded in place when the file changes.
+
+    The source may be ``snp_data.py`` (the ``snp_data`` literal), a JSON list or
+    JSON lines (one record per line). It is first loaded through ``load_index``,
+    so a matching compiled knowledge base is used at startup. A change is spotted
+    by mtime and size, confirmed by content hash, and only the rows that differ
+    are applied to a copy of the current index (after the first reload it is an
+    in-memory ``SNPIndex``). JSON lines, and ``snp_data.py`` while it keeps one
+    record per line, are diffed line by line: only added and removed lines are
+    parsed, so edits to a large knowledge base take milliseconds (identical lines
+    count once). Other layouts are parsed whole on every change.
+
+    Readers call ``snapshot()`` once per request and use that index throughout;
+    a reload swaps in a new snapshot and never touches one already handed out.
+    """
+
+    def __init__(self, path=DEFAULT_SOURCE):
+        self.path = path
+        self._reload_lock = threading.Lock()
+        self._derived_lock = threading.Lock()
+        self._derived = {}
+        self._format = _file_format(path)
+        self._previous = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._stamp = self._stat()
+        data = self._read()
+        self._index = load_index(path, data)
+        self._digest = self._index.fingerprint()
+        # Only the lines are kept for diffing; the rows they hold are read back from the index
+        self._lines = _line_set(data) if self._format in _LINE_PARSERS else {}
+
+    def snapshot(self):
+        return self._index
+
+    def _stat(self):
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size
+
+    def _read(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def _diff(self, data):
+        parse = _LINE_PARSERS.get(self._format)
+        if parse is not None:
+            try:
+                if self._format == "py":
+                    _check_python_layout(data)
+                return self._diff_lines(data, parse)
+            except (ValueError, SyntaxError):
+                if self._format != "py":
+                    raise
+        # Parsed whole and compared row by row with the current index
+        new_rows = _group_rows(json.loads(data) if self._format == "json" else parse_python_source(data))
+        change = diff_rows(_group_rows(self._index.records()), new_rows)
+        if parse is not None:
+            self._lines = _line_set(data)
+        return change
+
+    def _diff_lines(self, data, parse):
+        # Lines present in both versions are the same rows, so only the rest are parsed
+        lines = _line_set(data)
+        dropped = _group_rows(_parse_lines(parse, (line for line in self._lines if line not in lines)))
+        added = _group_rows(_parse_lines(parse, (line for line in lines if line not in self._lines)))
+
+        removed_keys, added_records = [], []
+        for key in dropped.keys() | added.keys():
+            old_group = self._index.lookup_genotype(*key)
+            group = list(old_group)
+            for record in dropped.get(key, ()):
+                if record in group:
+                    group.remove(record)
+            group += added.get(key, [])
+            if group == old_group:
+                continue # same row, only reformatted
+            if old_group:
+                removed_keys.append(key)
+            added_records += group
+        self._lines = lines
+        return KBChange(removed_keys, added_records)
+
+    def check(self):
+        """Reload the source file if it changed; return the applied ``KBChange``, or None."""
+        with self._reload_lock:
+            try:
+                stamp = self._stat()
+                if stamp == self._stamp:
+                    return None
+                data = self._read()
+            except OSError as e:
+                logger.warning("Could not read knowledge base %s: %s", self.path, e)
+                return None
+            self._stamp = stamp
+            digest = hashlib.sha256(data).hexdigest()
+            if digest == self._digest:
+                return None # touched, not edited
+
+            started = time.perf_counter()
+            try:
+                change = self._diff(data)
+            except (ValueError, SyntaxError) as e:
+                # A half-saved or broken file keeps the last good knowledge base in service
+                logger.error("Keeping the current knowledge base; could not parse %s: %s", self.path, e)
+                return None
+            if not (change.removed_keys or change.added_records):
+                self._digest = digest
+                return None # reformatted, same rows
+            old = self._index
+            # A compiled index is read-only; the first reload copies it into memory
+            base = old if isinstance(old, SNPIndex) else SNPIndex(old.records(), old.fingerprint())
+            new = base.updated(change.removed_keys, change.added_records, fingerprint=digest)
+            self._digest = digest
+            self._previous = (old, change)
+            self._index = new
+            logger.info("Reloaded %s in %.1f ms: %d row(s) removed, %d added",
+                        self.path, (time.perf_counter() - started) * 1000,
+                        len(change.removed_keys), len(change.added_records))
+            return change
+
+    def derived(self, name, build, update=None, index=None):
+        """Return ``build(index)`` for a snapshot, cached for the current one.
+
+        When the cached value belongs to the snapshot just replaced and ``update``
+        is given, the new value is ``update(old_value, change)`` rather than a rebuild.
+        """
+        index = self._index if index is None else index
+        with self._derived_lock:
+            entry = self._derived.get(name)
+            if entry is not None and entry[0] is index:
+                return entry[1]
+            previous = self._previous
+            if (entry is not None and update is not None and previous is not None
+                    and previous[0] is entry[0] and index is self._index):
+                value = update(entry[1], previous[1])
+            else:
+                value = build(index)
+            if index is self._index:
+                self._derived[name] = (index, value)
+            return value
+
+    def start(self, interval=DEFAULT_POLL_INTERVAL):
+        """Poll the source file every ``interval`` seconds on a daemon thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._watch, args=(interval,), name="nutrigene-kb-watch", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Knowledge base reload failed")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the knowledge base as JSON lines for hot reloading.")
+    parser.add_argument("output", help="Where to write the .jsonl file")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="Knowledge-base file to export")
+    args = parser.parse_args(argv)
+
+    records, _ = load_source(args.source)
+    write_jsonl(records, args.output)
+    print(f"Wrote {len(records)} records to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,443 @@
+import os
+import time
+from datetime import datetime
+from io import BytesIO
+
+from genotype_parser import iter_matched_records
+from instrumentation import add_span, incr, logger, span
+from report_cache import report_cache_key
+from panel import SUMMARY_COLUMNS, parse_panel, summarize_panel
+from risk_chart import (
+    CHART_MODE_RASTER, CHART_MODE_VECTOR, CHART_MODES, VECTOR_ASPECT, draw_aggregate_risk_chart_pdf, draw_risk_chart_pdf,
+    png_size, save_aggregate_risk_chart, save_risk_chart,
+)
+
+# Analysis and report building shared by the Streamlit app and the batch tools.
+# Nothing here depends on Streamlit, so it can run in worker processes.
+
+# Chart mode used when callers don't pass one ("raster" or "vector")
+DEFAULT_CHART_MODE = os.environ.get("NUTRIGENE_CHART_MODE", CHART_MODE_RASTER)
+
+# Bump whenever the report layout changes so cached PDFs are not reused
+LAYOUT_VERSION = 1
+
+
+def lookup_snp(snp_index, snp_id):
+    with span("lookup"):
+        return snp_index.lookup(snp_id)
+
+
+def analyze_genotype_file(snp_index, source):
+    with span("lookup"):
+        return list(iter_matched_records(source, snp_index))
+
+
+def build_chart_buffers(list_of_data_dicts):
+    with span("chart_render"):
+        return [save_risk_chart(data_record.get("Risk Level", "UNKNOWN")) for data_record in list_of_data_dicts]
+
+
+def _finish_report(pdf, layout_started, output=None):
+    # --- Footer ---
+    # The footer will always attempt to be at -15mm from the bottom of the CURRENT page.
+    # Because of the tighter content packing and page break logic, this should now be on the
+    # last content page, without triggering a blank page just for the footer.
+    pdf.set_y(-15) 
+    pdf.set_font("Arial", 'I', 8)
+    pdf.cell(0, 10, f"Page {pdf.page_no()}/{{nb}}", align="C")
+    pdf.alias_nb_pages() # This is crucial for {{nb}} to show total pages
+    add_span("pdf_layout", (time.perf_counter() - layout_started) * 1000)
+
+    with span("pdf_serialization"):
+        if output is not None:
+            # Written straight from fpdf's buffer to the caller's file or stream, with no BytesIO copy
+            pdf.output(output)
+            incr("pages", pdf.page_no())
+            incr("bytes", len(pdf.buffer))
+            return output
+        # Get the PDF content as bytes directly from fpdf
+        pdf_content = pdf.output(dest='B')
+    incr("pages", pdf.page_no())
+    incr("bytes", len(pdf_content))
+    return BytesIO(pdf_content)
+
+
+# Greek letters used in the knowledge base, spelled out for the latin-1 core fonts
+_TEXT_REPLACEMENTS = {"α": "alpha", "β": "beta", "γ": "gamma", "κ": "kappa", "–": "-", "—": "-", "’": "'"}
+
+
+def pdf_safe_text(value):
+    text = str(value).replace('\n', ' ').replace('\r', ' ')
+    for char, replacement in _TEXT_REPLACEMENTS.items():
+        text = text.replace(char, replacement)
+    return text.encode("latin-1", "replace").decode("latin-1")
+
+
+def generate_pdf_report(list_of_data_dicts, list_of_chart_buffers, chart_mode=None, output=None):
+    # fpdf is only imported once a report is actually requested.
+    # With ``output`` (a path or writable binary stream) the PDF is written there and ``output``
+    # is returned; otherwise the PDF comes back as a BytesIO.
+    from fpdf import FPDF
+
+    chart_mode = chart_mode or DEFAULT_CHART_MODE
+    if chart_mode not in CHART_MODES:
+        raise ValueError(f"Unknown chart mode: {chart_mode}")
+
+    layout_started = time.perf_counter()
+    pdf = FPDF()
+    pdf.add_page() # Start with the first page
+
+    # --- Header Section (Made smaller) ---
+    pdf.set_font("Arial", 'B', 16) # Smaller font for main title
+    pdf.cell(0, 10, "NutriGene SNP Analysis Report", ln=True, align="C") # Smaller cell height
+    pdf.set_font("Arial", '', 8) # Smaller font for date
+    pdf.cell(0, 4, f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M')}", ln=True, align="R") # Smaller cell height
+    pdf.ln(3) # Very small spacing after header
+
+    content_width = pdf.w - (2 * pdf.l_margin)
+    line_height_very_small_text = 6 # Adjusted line height for very small font
+
+    logger.debug("PDF layout: initial Y after header %.2f mm, page height %.2f mm, bottom margin %.2f mm",
+                 pdf.get_y(), pdf.h, pdf.b_margin)
+    # Remaining space before the physical bottom of the page, accounting for a typical footer height
+    usable_page_height_remaining = pdf.h - pdf.b_margin - pdf.get_y() - 15 # Approx footer height 15mm
+    logger.debug("Usable Y space from current Y to bottom margin (considering footer): %.2f mm", usable_page_height_remaining)
+
+    # Chart buffers already placed in this document, keyed by their chart cache key
+    embedded_images = {}
+
+    if not list_of_data_dicts:
+        pdf.set_font("Arial", size=9)
+        pdf.multi_cell(content_width, line_height_very_small_text, "No SNP data to report.", align="L")
+    else:
+        for i, data_record in enumerate(list_of_data_dicts):
+            # For subsequent genotypes, always add a new page to prevent extreme cramming and maintain readability.
+            # This means if rs1801133 is searched, it will produce 3 pages.
+            if i > 0:
+                logger.debug("Genotype %d: current Y before adding new page %.2f mm", i + 1, pdf.get_y())
+                pdf.add_page()
+                pdf.ln(5) # Minimal top margin on new page
+                logger.debug("New page added for Genotype %d. Current Y: %.2f mm", i + 1, pdf.get_y())
+
+            logger.debug("Processing Genotype %s for SNP %s", data_record.get('Genotype', 'N/A'), data_record.get('SNP', 'N/A').upper())
+
+            pdf.set_font("Arial", 'BU', 12) # Smaller font
+            pdf.cell(0, 8, pdf_safe_text(f"Genotype: {data_record.get('Genotype', 'N/A')} (SNP: {data_record.get('SNP', 'N/A').upper()})"), ln=True) # Smaller cell height
+            pdf.ln(2) # Minimal spacing
+
+            ordered_keys = ["Description", "Risk Level", "Dietary Recommendations", "Lifestyle Recommendations"]
+            
+            for key_title in ordered_keys:
+                if key_title in data_record:
+                    pdf.set_font("Arial", 'B', 9) # Smaller font for section titles
+                    pdf.cell(content_width, line_height_very_small_text, pdf_safe_text(f"{key_title.replace('_', ' ').title()}:"), ln=True)
+                    pdf.set_font("Arial", '', 8) # Smallest font for content text
+                    
+                    value = data_record[key_title]
+                    value_str = pdf_safe_text(value)
+                    
+                    start_y_multicell = pdf.get_y()
+                    pdf.multi_cell(content_width, line_height_very_small_text, value_str, align="J") # Justify to pack tightly
+                    height_taken_multicell = pdf.get_y() - start_y_multicell
+                    logger.debug("Item '%s': height taken %.2f mm. Current Y: %.2f mm", key_title, height_taken_multicell, pdf.get_y())
+                    pdf.ln(0.5) # Extremely minimal spacing
+
+            other_keys_present = [k for k in data_record if k not in ordered_keys and k.lower() != 'snp' and k.lower() != 'genotype']
+            if other_keys_present:
+                pdf.set_font("Arial", 'B', 9) # Smaller font
+                pdf.cell(content_width, line_height_very_small_text, "Additional Details:", ln=True)
+                pdf.set_font("Arial", '', 8) # Smallest font
+                for key in other_keys_present:
+                    value = data_record[key]
+                    value_str = pdf_safe_text(value)
+                    key_label = pdf_safe_text(f"{key.replace('_', ' ').title()}: ")
+                    
+                    pdf.set_font("Arial", 'B', 8) # Smaller font for key
+                    pdf.write(line_height_very_small_text, key_label)
+                    pdf.set_font("Arial", '', 8) # Smallest font for value
+                    remaining_width = content_width - pdf.get_string_width(key_label)
+                    
+                    start_y_inline_multicell = pdf.get_y()
+                    pdf.multi_cell(remaining_width, line_height_very_small_text, value_str, align="L")
+                    height_taken_inline_multicell = pdf.get_y() - start_y_inline_multicell
+                    logger.debug("Item '%s': height taken %.2f mm. Current Y: %.2f mm", key, height_taken_inline_multicell, pdf.get_y())
+                    pdf.ln(0.5) # Extremely minimal spacing
+
+            # Minimal space before the chart
+            pdf.ln(1) 
+
+            # --- Chart placement (Inside the loop, for current genotype) ---
+            if chart_mode == CHART_MODE_VECTOR:
+                chart_buffer = None
+            elif i < len(list_of_chart_buffers) and list_of_chart_buffers[i]:
+                chart_buffer = list_of_chart_buffers[i]
+            else:
+                continue
+            try:
+                image_width_on_page = content_width * 0.55 # EVEN MORE REDUCED CHART SIZE (e.g., 55% of content width)
+                if chart_buffer is None:
+                    estimated_chart_height_mm = image_width_on_page * VECTOR_ASPECT
+                else:
+                    # Cached charts carry their pixel size; fall back to the PNG header otherwise
+                    if hasattr(chart_buffer, "width_px"):
+                        original_img_width_px, original_img_height_px = chart_buffer.width_px, chart_buffer.height_px
+                    else:
+                        original_img_width_px, original_img_height_px = png_size(chart_buffer.getvalue())
+                    estimated_chart_height_mm = (original_img_height_px / original_img_width_px) * image_width_on_page
+                # Minimal padding buffer
+                estimated_chart_height_with_padding = estimated_chart_height_mm + 2 # Minimal padding
+
+                logger.debug("Chart placement (Genotype %d): current Y %.2f mm, estimated chart height with padding %.2f mm",
+                             i + 1, pdf.get_y(), estimated_chart_height_with_padding)
+
+                # Remaining space on the page, ensuring enough for chart AND footer.
+                # Footer takes ~10mm line height, plus 5mm bottom margin = 15mm.
+                remaining_space_for_content_before_footer = pdf.h - pdf.get_y() - pdf.b_margin 
+
+                logger.debug("Available Y space from current Y to bottom margin: %.2f mm", remaining_space_for_content_before_footer)
+
+                # If remaining space is less than what the chart needs PLUS a small buffer for safety, add a new page.
+                # The 5mm buffer here is crucial to prevent the chart from *just* overflowing and causing a blank page.
+                if remaining_space_for_content_before_footer < (estimated_chart_height_with_padding + 5): 
+                    logger.debug("Adding new page for chart: remaining space %.2f mm < minimum required %.2f mm",
+                                 remaining_space_for_content_before_footer, estimated_chart_height_with_padding + 5)
+                    pdf.add_page()
+                    pdf.ln(5) # Minimal top margin on new page for chart
+                    logger.debug("New page for chart. Current Y: %.2f mm", pdf.get_y())
+                else:
+                    logger.debug("Chart fits on current page")
+
+                # Calculate X position to center the image
+                x_position = pdf.l_margin + (content_width - image_width_on_page) / 2
+
+                if chart_buffer is None:
+                    # Drawn with vector operators straight into the page: no image to decode or embed
+                    chart_top = pdf.get_y()
+                    drawn_height = draw_risk_chart_pdf(pdf, data_record.get("Risk Level", "UNKNOWN"), x_position, chart_top, image_width_on_page)
+                    pdf.set_y(chart_top + drawn_height)
+                    incr("vector_charts")
+                else:
+                    # Embed straight from memory. fpdf keys images by a hash of their bytes,
+                    # so a chart repeated across genotypes is stored once and referenced again.
+                    image_key = getattr(chart_buffer, "cache_key", None) or id(chart_buffer)
+                    image_source = embedded_images.setdefault(image_key, chart_buffer)
+                    image_source.seek(0)
+                    pdf.image(image_source, x=x_position, w=image_width_on_page, h=estimated_chart_height_mm)
+                    incr("images")
+                pdf.ln(1) # Minimal space after image
+                logger.debug("Chart added. Current Y: %.2f mm", pdf.get_y())
+
+            except Exception as e:
+                logger.error("Could not add chart for Genotype %d to PDF: %s", i + 1, e)
+                pdf.set_font("Arial", size=8)
+                pdf.multi_cell(content_width, line_height_very_small_text, f"Error: Could not render risk level chart for Genotype {i+1}.", align="C")
+            # --- End Chart Placement for current genotype ---
+    
+    return _finish_report(pdf, layout_started, output)
+
+
+def build_report(list_of_data_dicts, chart_mode=None, output=None):
+    chart_mode = chart_mode or DEFAULT_CHART_MODE
+    # Vector charts are drawn by the report itself, so no PNGs are needed
+    list_of_chart_buffers = [] if chart_mode == CHART_MODE_VECTOR else build_chart_buffers(list_of_data_dicts)
+    return generate_pdf_report(list_of_data_dicts, list_of_chart_buffers, chart_mode, output)
+
+
+def _start_report(title, chart_mode):
+    """Check ``chart_mode`` and open a PDF with the summary-report header: title, then the date.
+
+    Returns the PDF, the chart mode (default filled in) and when layout started.
+    """
+    from fpdf import FPDF
+
+    chart_mode = chart_mode or DEFAULT_CHART_MODE
+    if chart_mode not in CHART_MODES:
+        raise ValueError(f"Unknown chart mode: {chart_mode}")
+
+    layout_started = time.perf_counter()
+    pdf = FPDF()
+    pdf.add_page()
+
+    # --- Header Section ---
+    pdf.set_font("Arial", 'B', 16)
+    pdf.cell(0, 10, title, ln=True, align="C")
+    pdf.set_font("Arial", '', 8)
+    pdf.cell(0, 4, f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M')}", ln=True, align="R")
+    pdf.ln(3)
+    return pdf, chart_mode, layout_started
+
+
+def _draw_table(pdf, columns, shares, rows, title=None, line_height=6):
+    """Bordered table over the content width, ``shares`` giving each column's fraction of it.
+
+    The column header is repeated on every page the rows run onto, and a title is
+    never left alone at the bottom of a page.
+    """
+    widths = [(pdf.w - 2 * pdf.l_margin) * share for share in shares]
+
+    def header():
+        pdf.set_font("Arial", 'B', 8)
+        pdf.set_fill_color(213, 240, 242)
+        for column, width in zip(columns, widths):
+            pdf.cell(width, line_height, column, border=1, fill=True)
+        pdf.ln(line_height)
+        pdf.set_font("Arial", '', 8)
+
+    if title is not None:
+        if pdf.get_y() + 8 + 2 * line_height > pdf.h - pdf.b_margin:
+            pdf.add_page()
+        pdf.set_font("Arial", 'B', 11)
+        pdf.cell(0, 8, title, ln=True)
+    header()
+    for row in rows:
+        if pdf.get_y() + line_height > pdf.h - pdf.b_margin:
+            pdf.add_page()
+            header()
+        for value, width in zip(row, widths):
+            value = pdf_safe_text(value)
+            # Clip to the column so every row stays one line high
+            while value and pdf.get_string_width(value) > width - 2:
+                value = value[:-1]
+            pdf.cell(width, line_height, value, border=1)
+        pdf.ln(line_height)
+    pdf.ln(3)
+
+
+def _draw_aggregate_chart(pdf, risk_counts, chart_mode, **chart_labels):
+    """Centred aggregate risk chart, on a new page if it does not fit on this one."""
+    content_width = pdf.w - (2 * pdf.l_margin)
+    chart_width = content_width * 0.55
+    chart_x = pdf.l_margin + (content_width - chart_width) / 2
+    with span("chart_render"):
+        chart_buffer = None if chart_mode == CHART_MODE_VECTOR else save_aggregate_risk_chart(risk_counts, **chart_labels)
+    if chart_buffer is None:
+        chart_height = chart_width * VECTOR_ASPECT
+    else:
+        chart_height = chart_buffer.height_px / chart_buffer.width_px * chart_width
+    if pdf.h - pdf.get_y() - pdf.b_margin < chart_height + 7:
+        pdf.add_page()
+        pdf.ln(5)
+    chart_top = pdf.get_y()
+    if chart_buffer is None:
+        draw_aggregate_risk_chart_pdf(pdf, risk_counts, chart_x, chart_top, chart_width, **chart_labels)
+        incr("vector_charts")
+    else:
+        pdf.image(chart_buffer, x=chart_x, y=chart_top, w=chart_width, h=chart_height)
+        incr("images")
+    pdf.set_y(chart_top + chart_height)
+    pdf.ln(3)
+
+
+def resolve_panel(panel_resolver, panel_text):
+    with span("lookup"):
+        return panel_resolver.resolve(parse_panel(panel_text))
+
+
+def generate_panel_report(list_of_data_dicts, chart_mode=None, unmatched_rsids=(), output=None):
+    """Consolidated report for a panel: summary table, one aggregate risk chart, then compact details."""
+    pdf, chart_mode, layout_started = _start_report("NutriGene SNP Panel Report", chart_mode)
+
+    content_width = pdf.w - (2 * pdf.l_margin)
+    line_height = 6
+    snp_count = len({data_record.get("SNP", "").lower() for data_record in list_of_data_dicts})
+    pdf.set_font("Arial", '', 9)
+    pdf.multi_cell(content_width, line_height, f"{len(list_of_data_dicts)} genotype record(s) matched across {snp_count} SNP(s).", align="L")
+    pdf.ln(0)
+    if unmatched_rsids:
+        pdf.multi_cell(content_width, line_height, f"Not in the knowledge base: {', '.join(r.upper() for r in unmatched_rsids)}", align="L")
+        pdf.ln(0)
+    pdf.ln(2)
+
+    if not list_of_data_dicts:
+        pdf.multi_cell(content_width, line_height, "No SNP data to report.", align="L")
+        return _finish_report(pdf, layout_started, output)
+
+    # --- Summary Table ---
+    _draw_table(pdf, SUMMARY_COLUMNS, (0.16, 0.18, 0.14, 0.34, 0.18),
+                [[str(data_record.get(column, "")).upper() if column == "SNP" else data_record.get(column, "")
+                  for column in SUMMARY_COLUMNS] for data_record in list_of_data_dicts], line_height=line_height)
+
+    # --- Aggregate Chart ---
+    _draw_aggregate_chart(pdf, summarize_panel(list_of_data_dicts), chart_mode)
+
+    # --- Details, packed one after another rather than a page per genotype ---
+    pdf.set_font("Arial", 'B', 11)
+    pdf.cell(0, 8, "Details", ln=True)
+    for data_record in list_of_data_dicts:
+        pdf.set_font("Arial", 'B', 9)
+        pdf.multi_cell(content_width, line_height, pdf_safe_text(
+                       f"{data_record.get('SNP', 'N/A').upper()} ({data_record.get('Gene Name', 'N/A')}), "
+                       f"Genotype {data_record.get('Genotype', 'N/A')}, Risk: {data_record.get('Risk Level', 'N/A')}"),
+                       align="L")
+        pdf.ln(0)
+        pdf.set_font("Arial", '', 8)
+        for key in ("Effect", "Nutrient", "Recommendation", "Local Food Recommendations (Pakistani)"):
+            if key in data_record:
+                pdf.multi_cell(content_width, 5, pdf_safe_text(f"{key}: {data_record[key]}"), align="L")
+                pdf.ln(0)
+        pdf.ln(1.5)
+
+    return _finish_report(pdf, layout_started, output)
+
+
+def generate_cohort_report(summary, chart_mode=None, output=None, top_snps=25):
+    """Cohort summary: overall risk chart, per-nutrient shares, most frequent High-risk SNPs and
+    how many High-risk genotypes samples carry. ``summary`` is a ``cohort.CohortSummary``."""
+    pdf, chart_mode, layout_started = _start_report("NutriGene Cohort Report", chart_mode)
+
+    content_width = pdf.w - (2 * pdf.l_margin)
+    line_height = 6
+    pdf.set_font("Arial", '', 9)
+    pdf.multi_cell(content_width, line_height,
+                   f"{len(summary.samples)} sample(s) x {len(summary.layout.rsids)} knowledge-base SNP(s).", align="L")
+    if summary.failed:
+        pdf.multi_cell(content_width, line_height, pdf_safe_text(
+            f"{len(summary.failed)} sample file(s) could not be read and count as No call throughout: "
+            + ", ".join(summary.failed)), align="L")
+    pdf.ln(2)
+
+    # --- Aggregate Chart ---
+    _draw_aggregate_chart(pdf, summary.risk_counts(), chart_mode, title="Cohort Risk Summary", unit="calls")
+
+    def percent(share):
+        return f"{share * 100:.1f}%"
+
+    # "Not in KB": called, but with a genotype the knowledge base has no risk level for
+    _draw_table(pdf, ["Nutrient", "High", "Medium", "Low", "Not in KB", "No call", "Samples with High"],
+                (0.24, 0.11, 0.11, 0.11, 0.12, 0.11, 0.2),
+                [(row["Nutrient"], percent(row["High"]), percent(row["Medium"]), percent(row["Low"]),
+                  percent(row["Not in KB"]), percent(row["No call"]), str(row["Samples with High"]))
+                 for row in summary.nutrient_rows()], title="Risk by Nutrient", line_height=line_height)
+    _draw_table(pdf, ["SNP", "Gene Name", "High", "Medium", "Low", "Not in KB", "No call"],
+                (0.16, 0.2, 0.12, 0.12, 0.12, 0.14, 0.14),
+                [(row["SNP"].upper(), row["Gene Name"], percent(row["High"]), percent(row["Medium"]),
+                  percent(row["Low"]), percent(row["Not in KB"]), percent(row["No call"]))
+                 for row in summary.snp_rows(top_snps)],
+                title=f"Most Frequent High-Risk SNPs (top {top_snps})", line_height=line_height)
+    _draw_table(pdf, ["High-risk genotypes", "Samples"], (0.4, 0.3), summary.high_count_distribution(),
+                title="High-Risk Genotypes per Sample", line_height=line_height)
+
+    return _finish_report(pdf, layout_started, output)
+
+
+def cached_report_path(report_cache, list_of_data_dicts, chart_mode=None):
+    """Path of the cached PDF for these records; a miss builds it straight into the cache file.
+
+    Hits never load fpdf or matplotlib, and the report is never held in memory as bytes.
+    """
+    chart_mode = chart_mode or DEFAULT_CHART_MODE
+    key = report_cache_key(list_of_data_dicts, LAYOUT_VERSION, chart_mode)
+    return report_cache.path_or_build(key, lambda stream: build_report(list_of_data_dicts, chart_mode, stream))
+
+
+def cached_panel_report_path(report_cache, list_of_data_dicts, chart_mode=None, unmatched_rsids=()):
+    chart_mode = chart_mode or DEFAULT_CHART_MODE
+    key = report_cache_key(list_of_data_dicts, LAYOUT_VERSION, chart_mode, kind="panel", extra=sorted(unmatched_rsids))
+    return report_cache.path_or_build(
+        key, lambda stream: generate_panel_report(list_of_data_dicts, chart_mode, unmatched_rsids, stream)
+    )
+
+
+def read_report(path):
+    with open(path, "rb") as f:
+        return BytesIO(f.read())
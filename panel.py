@@ -0,0 +1,107 @@
+import re
+
+from snp_index import normalize_genotype, normalize_rsid
+
+_TOKEN_SPLIT = re.compile(r"[\s,;:|]+")
+_RSID = re.compile(r"^rs\d+$", re.IGNORECASE)
+_GENOTYPE = re.compile(r"^[ACGTDI]{1,2}$", re.IGNORECASE)
+
+SUMMARY_COLUMNS = ["SNP", "Gene Name", "Genotype", "Nutrient", "Risk Level"]
+
+
+def parse_panel(text):
+    """Parse a pasted panel into ``(rsid, genotype_or_None)`` pairs.
+
+    Accepts rsIDs separated by newlines, commas or spaces, each optionally
+    followed by its genotype (``rs1801133 TT``, ``rs4988235,AG``). Repeats are dropped.
+    """
+    entries = []
+    seen = set()
+    tokens = [t for t in _TOKEN_SPLIT.split(text or "") if t]
+    for pos, token in enumerate(tokens):
+        if not _RSID.match(token):
+            continue
+        genotype = None
+        if pos + 1 < len(tokens) and _GENOTYPE.match(tokens[pos + 1]):
+            genotype = tokens[pos + 1].upper()
+        key = (normalize_rsid(token), genotype)
+        if key not in seen:
+            seen.add(key)
+            entries.append(key)
+    return entries
+
+
+class PanelResolver:
+    """Resolves whole panels against the knowledge base with one vectorized join.
+
+    The knowledge-base frame and its normalized join keys are built once; each
+    panel is then a single ``merge`` however many rsIDs it holds.
+    """
+
+    def __init__(self, snp_index):
+        # pandas is only loaded once panel analysis is actually used
+        import pandas as pd
+
+        self._pd = pd
+        kb = pd.DataFrame(list(snp_index.records()))
+        self.columns = list(kb.columns)
+        self._kb = self._with_keys(kb, 0)
+
+    @staticmethod
+    def _with_keys(kb, first_order):
+        kb["_rsid"] = kb["SNP"].map(normalize_rsid)
+        kb["_genotype_key"] = kb["Genotype"].map(normalize_genotype)
+        kb["_row_key"] = kb["_rsid"] + " " + kb["_genotype_key"]
+        kb["_kb_order"] = range(first_order, first_order + len(kb))
+        return kb
+
+    def updated(self, removed_keys, added_records):
+        """Return a resolver with the given rows replaced, without rebuilding the whole frame."""
+        pd = self._pd
+        kb = self._kb
+        removed = {f"{rsid} {genotype}" for rsid, genotype in removed_keys}
+        if removed:
+            kb = kb[~kb["_row_key"].isin(removed)]
+        columns = list(self.columns)
+        if added_records:
+            added = pd.DataFrame(list(added_records))
+            columns += [c for c in added.columns if c not in columns]
+            first_order = int(self._kb["_kb_order"].max()) + 1 if len(self._kb) else 0
+            kb = pd.concat([kb, self._with_keys(added, first_order)], ignore_index=True)
+
+        resolver = object.__new__(PanelResolver)
+        resolver._pd, resolver._kb, resolver.columns = pd, kb, columns
+        return resolver
+
+    def resolve(self, entries):
+        """Return ``(records, unmatched_rsids)`` for a parsed panel, in panel order."""
+        pd = self._pd
+        if not entries:
+            return [], []
+        panel = pd.DataFrame(entries, columns=["_rsid", "Genotype"])
+        panel["_order"] = range(len(panel))
+        with_genotype = panel["Genotype"].notna()
+
+        # Entries with a genotype match on (rsID, genotype); bare rsIDs match every genotype
+        typed = panel[with_genotype].assign(_genotype_key=lambda df: df["Genotype"].map(normalize_genotype))
+        matched = pd.concat([
+            typed[["_rsid", "_genotype_key", "_order"]].merge(self._kb, on=["_rsid", "_genotype_key"]),
+            panel.loc[~with_genotype, ["_rsid", "_order"]].merge(self._kb, on="_rsid"),
+        ], ignore_index=True)
+        # A record requested twice (e.g. "rs1801133" and "rs1801133 TT") is reported once
+        matched = matched.sort_values(["_order", "_kb_order"], kind="stable").drop_duplicates("_kb_order")
+
+        unmatched = panel.loc[~panel["_order"].isin(matched["_order"]), "_rsid"].tolist()
+        records = matched[self.columns].to_dict("records")
+        # Drop the fields a record did not have in the knowledge base
+        records = [{k: v for k, v in record.items() if not (isinstance(v, float) and v != v)} for record in records]
+        return records, unmatched
+
+
+def summarize_panel(records):
+    """Per-risk-level counts across a resolved panel, e.g. ``{'High': 3, 'Medium': 1, 'Low': 0}``."""
+    counts = {"High": 0, "Medium": 0, "Low": 0}
+    for record in records:
+        risk = record.get("Risk Level", "UNKNOWN")
+        counts[risk] = counts.get(risk, 0) + 1
+    return counts
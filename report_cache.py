@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from instrumentation import incr
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "NUTRIGENE_REPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "nutrigene-report-cache")
+)
+DEFAULT_MAX_BYTES = int(float(os.environ.get("NUTRIGENE_REPORT_CACHE_MB", 256)) * 1024 * 1024)
+# Other processes write to the same directory, so its real size is re-read at least this often
+RESCAN_SECONDS = 5
+
+
+def report_cache_key(list_of_data_dicts, layout_version, chart_mode, kind="genotypes", extra=None):
+    """Content hash of everything a generated report depends on."""
+    payload = json.dumps(
+        {"records": list_of_data_dicts, "layout": layout_version, "chart_mode": chart_mode, "kind": kind, "extra": extra},
+        sort_keys=True, default=str, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReportCache:
+    """Content-addressed on-disk store of generated PDF reports with size-bounded LRU eviction.
+
+    Entries are named ``<kb fingerprint>-<report key>.pdf``; a file's mtime is its
+    last use. The size bound covers every entry in the directory, whichever process
+    or knowledge-base version wrote it, so entries for an old fingerprint stay
+    readable until they are the least recently used.
+    """
+
+    def __init__(self, kb_fingerprint, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.prefix = kb_fingerprint[:16]
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # Directory size as of the last scan plus what this process wrote since
+        self._estimate = 0
+        self._scanned_at = None
+
+    def _name(self, key):
+        return f"{self.prefix}-{key}.pdf"
+
+    def path(self, key):
+        return os.path.join(self.directory, self._name(key))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _write(self, key, write):
+        # Written under a temporary name and renamed, so readers never see a partial report
+        name = self._name(key)
+        path = os.path.join(self.directory, name)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+                size = f.tell()
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        with self._lock:
+            self._estimate += size
+            if (self._estimate > self.max_bytes or self._scanned_at is None
+                    or time.monotonic() - self._scanned_at > RESCAN_SECONDS):
+                self._evict(keep=path)
+        return path
+
+    def _scan(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(".pdf"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue # removed by another process
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _evict(self, keep=None):
+        # Least recently used first, until the directory is back under its bound.
+        # ``keep`` is the entry about to be returned and is never removed, even when
+        # it alone exceeds the bound.
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._remove(path)
+            total -= size
+            incr("report_cache_evictions")
+        self._estimate = total
+        self._scanned_at = time.monotonic()
+
+    def path_or_build(self, key, write):
+        """Return the path of the cached report for ``key``, calling ``write(stream)`` to create it on a miss.
+
+        The report goes straight into the cache file, so large reports are never
+        held in memory; callers read or send the file from disk.
+        """
+        path = self.path(key)
+        try:
+            os.utime(path) # mark as recently used
+        except OSError:
+            incr("report_cache_miss")
+            return self._write(key, write)
+        incr("report_cache_hit")
+        return path
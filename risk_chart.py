@@ -0,0 +1,332 @@
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO, UnsupportedOperation
+
+RISK_LEVELS = ("Low", "Medium", "High", "UNKNOWN")
+RISK_MAPPING = {'Low': 1, 'Medium': 2, 'High': 3, 'UNKNOWN': 0}
+RISK_COLORS = {'High': 'red', 'Medium': 'orange', 'Low': 'green', 'UNKNOWN': 'gray'}
+
+DEFAULT_FIGSIZE = (4.5, 3) # Slightly smaller chart dimensions
+DEFAULT_DPI = 200 # Lower DPI to potentially save size/render time
+
+# How report charts are embedded: a cached matplotlib PNG, or drawn natively with fpdf
+CHART_MODE_RASTER = "raster"
+CHART_MODE_VECTOR = "vector"
+CHART_MODES = (CHART_MODE_RASTER, CHART_MODE_VECTOR)
+
+# Bars of the panel summary chart, left to right
+AGGREGATE_LEVELS = ("Low", "Medium", "High")
+
+# Height/width of the vector chart, matching the cropped raster chart
+VECTOR_ASPECT = 0.66
+# RGB equivalents of the matplotlib colour names in RISK_COLORS
+RISK_RGB = {'High': (255, 0, 0), 'Medium': (255, 165, 0), 'Low': (0, 128, 0), 'UNKNOWN': (128, 128, 128)}
+
+# Rendered charts keyed by (risk level, figsize, dpi); module level so every
+# Streamlit session and rerun in the process shares it
+_chart_cache = {}
+_chart_cache_lock = threading.Lock()
+# Aggregate charts differ with every panel's counts, so only the most recently used are kept
+AGGREGATE_CACHE_SIZE = int(os.environ.get("NUTRIGENE_AGGREGATE_CHART_CACHE", 32))
+_aggregate_cache = OrderedDict()
+_aggregate_cache_lock = threading.Lock()
+
+
+class ChartBuffer(BytesIO):
+    """Read-only PNG buffer carrying the pixel size of the rendered chart."""
+
+    def __init__(self, png_bytes, width_px, height_px, cache_key=None):
+        super().__init__(png_bytes)
+        self.width_px = width_px
+        self.height_px = height_px
+        self.cache_key = cache_key
+
+    def writable(self):
+        return False
+
+    def write(self, data):
+        raise UnsupportedOperation("chart buffers are read-only")
+
+    def writelines(self, lines):
+        raise UnsupportedOperation("chart buffers are read-only")
+
+    def truncate(self, size=None):
+        raise UnsupportedOperation("chart buffers are read-only")
+
+
+def render_risk_chart(risk_level, figsize=DEFAULT_FIGSIZE, dpi=DEFAULT_DPI):
+    # matplotlib is imported on first render only, keeping it off the startup path
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    # Uses the object-oriented API rather than pyplot, whose global figure
+    # state is not safe to share between concurrent sessions
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+
+    risk_value = RISK_MAPPING.get(risk_level, 0)
+    color = RISK_COLORS.get(risk_level, 'gray')
+
+    ax.bar(['Your Risk Level'], [risk_value], color=color, width=0.5, edgecolor='black', linewidth=1.5)
+
+    ax.set_ylim(0, 3.5)
+    ax.set_ylabel('Risk Severity', fontsize=10, fontweight='bold') # Smaller font
+
+    ax.set_yticks([1, 2, 3])
+    ax.set_yticklabels(['Low', 'Medium', 'High'], fontsize=8) # Smaller font
+
+    ax.grid(axis='y', linestyle='--', alpha=0.7)
+
+    ax.set_xticks(['Your Risk Level'])
+    ax.set_xticklabels(['Your Current Risk Level'], fontsize=8) # Smaller font
+
+    ax.set_title(f"SNP Risk Assessment: {risk_level}", fontsize=12, fontweight='bold') # Smaller font
+
+    ax.text('Your Risk Level', risk_value + 0.1, risk_level, ha='center', va='bottom',
+            color='black', fontsize=10, fontweight='bold') # Smaller font
+
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.spines['left'].set_linewidth(0.5)
+    ax.spines['bottom'].set_linewidth(0.5)
+
+    buf = BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight", dpi=dpi)
+    return buf.getvalue()
+
+
+def png_size(png_bytes):
+    # Width and height live at fixed offsets in the PNG IHDR chunk
+    return int.from_bytes(png_bytes[16:20], "big"), int.from_bytes(png_bytes[20:24], "big")
+
+
+def _cached_chart(key, render):
+    entry = _chart_cache.get(key)
+    if entry is None:
+        with _chart_cache_lock:
+            entry = _chart_cache.get(key)
+            if entry is None:
+                png_bytes = render()
+                entry = (png_bytes, *png_size(png_bytes))
+                _chart_cache[key] = entry
+    return entry
+
+
+def get_chart_entry(risk_level, figsize=DEFAULT_FIGSIZE, dpi=DEFAULT_DPI):
+    """Return the cached ``(png_bytes, width_px, height_px)`` for a chart, rendering it once."""
+    key = (risk_level, tuple(figsize), dpi)
+    return _cached_chart(key, lambda: render_risk_chart(risk_level, figsize, dpi))
+
+
+def save_risk_chart(risk_level, figsize=DEFAULT_FIGSIZE, dpi=DEFAULT_DPI):
+    png_bytes, width_px, height_px = get_chart_entry(risk_level, figsize, dpi)
+    # Each caller gets its own read position over the shared bytes
+    return ChartBuffer(png_bytes, width_px, height_px, cache_key=(risk_level, tuple(figsize), dpi))
+
+
+def _aggregate_counts(risk_counts):
+    return tuple(risk_counts.get(level, 0) for level in AGGREGATE_LEVELS)
+
+
+def render_aggregate_risk_chart(risk_counts, figsize=DEFAULT_FIGSIZE, dpi=DEFAULT_DPI,
+                                title="Panel Risk Summary", unit="variants"):
+    # One bar per risk level, counting the matched variants of a panel (or the calls of a cohort)
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    counts = _aggregate_counts(risk_counts)
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+
+    ax.bar(AGGREGATE_LEVELS, counts, color=[RISK_COLORS[level] for level in AGGREGATE_LEVELS],
+           width=0.5, edgecolor='black', linewidth=1.5)
+    ax.set_ylim(0, max(max(counts), 1) * 1.2)
+    ax.set_ylabel(unit.capitalize(), fontsize=10, fontweight='bold')
+    ax.grid(axis='y', linestyle='--', alpha=0.7)
+    ax.tick_params(axis='x', labelsize=8)
+    ax.tick_params(axis='y', labelsize=8)
+    ax.yaxis.get_major_locator().set_params(integer=True)
+    ax.set_title(f"{title} ({sum(counts)} {unit})", fontsize=12, fontweight='bold')
+    for level, count in zip(AGGREGATE_LEVELS, counts):
+        ax.text(level, count + 0.05, str(count), ha='center', va='bottom', color='black', fontsize=10, fontweight='bold')
+
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.spines['left'].set_linewidth(0.5)
+    ax.spines['bottom'].set_linewidth(0.5)
+
+    buf = BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight", dpi=dpi)
+    return buf.getvalue()
+
+
+def save_aggregate_risk_chart(risk_counts, figsize=DEFAULT_FIGSIZE, dpi=DEFAULT_DPI,
+                              title="Panel Risk Summary", unit="variants"):
+    key = ("aggregate", _aggregate_counts(risk_counts), tuple(figsize), dpi, title, unit)
+    with _aggregate_cache_lock:
+        entry = _aggregate_cache.get(key)
+        if entry is not None:
+            _aggregate_cache.move_to_end(key)
+    if entry is None:
+        # Rendered outside the lock, so a new panel never holds up other sessions' charts
+        png_bytes = render_aggregate_risk_chart(risk_counts, figsize, dpi, title, unit)
+        entry = (png_bytes, *png_size(png_bytes))
+        with _aggregate_cache_lock:
+            _aggregate_cache[key] = entry
+            while len(_aggregate_cache) > AGGREGATE_CACHE_SIZE:
+                _aggregate_cache.popitem(last=False)
+    return ChartBuffer(*entry, cache_key=key)
+
+
+def warm_chart_cache(figsize=DEFAULT_FIGSIZE, dpi=DEFAULT_DPI):
+    for risk_level in RISK_LEVELS:
+        get_chart_entry(risk_level, figsize, dpi)
+    return len(_chart_cache)
+
+
+def warm_chart_cache_in_background(figsize=DEFAULT_FIGSIZE, dpi=DEFAULT_DPI):
+    # Lets a server come up without waiting on matplotlib; a chart requested
+    # before warming finishes just renders under the cache lock as usual
+    thread = threading.Thread(target=warm_chart_cache, args=(figsize, dpi), name="warm-risk-charts", daemon=True)
+    thread.start()
+    return thread
+
+
+def draw_risk_chart_pdf(pdf, risk_level, x, y, w):
+    """Draw the risk chart with fpdf vector primitives at (x, y), ``w`` mm wide.
+
+    Mirrors ``render_risk_chart``: title, y-axis label, Low/Medium/High ticks with
+    dashed grid lines, the coloured bar with its label, and the left/bottom spines.
+    Returns the height used, in mm.
+    """
+    h = w * VECTOR_ASPECT
+    risk_value = RISK_MAPPING.get(risk_level, 0)
+
+    # Plot area inside the chart box, leaving room for the title and axis labels
+    plot_left = x + w * 0.18
+    plot_right = x + w * 0.97
+    plot_top = y + h * 0.14
+    plot_bottom = y + h * 0.86
+    plot_w = plot_right - plot_left
+
+    def y_for(value):
+        return plot_bottom - (value / 3.5) * (plot_bottom - plot_top)
+
+    with pdf.local_context():
+        pdf.set_text_color(0, 0, 0)
+
+        # Title
+        pdf.set_font("Helvetica", 'B', 10)
+        title = f"SNP Risk Assessment: {risk_level}"
+        pdf.text(x + (w - pdf.get_string_width(title)) / 2, y + h * 0.08, title)
+
+        # Grid lines and y tick labels
+        pdf.set_font("Helvetica", '', 7)
+        pdf.set_line_width(0.15)
+        pdf.set_draw_color(178, 178, 178)
+        pdf.set_dash_pattern(dash=1, gap=0.7)
+        for value, label in ((1, 'Low'), (2, 'Medium'), (3, 'High')):
+            tick_y = y_for(value)
+            pdf.line(plot_left, tick_y, plot_right, tick_y)
+            pdf.text(plot_left - 1.5 - pdf.get_string_width(label), tick_y + 0.8, label)
+        pdf.set_dash_pattern()
+
+        # Bar with black edge
+        bar_w = plot_w * 0.9
+        bar_x = plot_left + (plot_w - bar_w) / 2
+        bar_top = y_for(risk_value)
+        pdf.set_fill_color(*RISK_RGB.get(risk_level, RISK_RGB['UNKNOWN']))
+        pdf.set_draw_color(0, 0, 0)
+        pdf.set_line_width(0.5)
+        if risk_value > 0:
+            pdf.rect(bar_x, bar_top, bar_w, plot_bottom - bar_top, style="DF")
+
+        # Risk label just above the bar
+        pdf.set_font("Helvetica", 'B', 8)
+        pdf.text(bar_x + (bar_w - pdf.get_string_width(risk_level)) / 2, bar_top - 1, risk_level)
+
+        # Left and bottom spines
+        pdf.set_line_width(0.15)
+        pdf.line(plot_left, plot_top, plot_left, plot_bottom)
+        pdf.line(plot_left, plot_bottom, plot_right, plot_bottom)
+
+        # x tick label
+        pdf.set_font("Helvetica", '', 7)
+        x_label = 'Your Current Risk Level'
+        pdf.text(plot_left + (plot_w - pdf.get_string_width(x_label)) / 2, plot_bottom + 3.5, x_label)
+
+        # Rotated y-axis label
+        pdf.set_font("Helvetica", 'B', 8)
+        y_label = 'Risk Severity'
+        label_x = x + w * 0.04
+        label_y = plot_top + (plot_bottom - plot_top + pdf.get_string_width(y_label)) / 2
+        with pdf.rotation(90, label_x, label_y):
+            pdf.text(label_x, label_y, y_label)
+
+    return h
+
+
+def draw_aggregate_risk_chart_pdf(pdf, risk_counts, x, y, w, title="Panel Risk Summary", unit="variants"):
+    """Vector counterpart of ``render_aggregate_risk_chart``; returns the height used, in mm."""
+    h = w * VECTOR_ASPECT
+    counts = _aggregate_counts(risk_counts)
+    top_value = max(max(counts), 1) * 1.2
+
+    plot_left = x + w * 0.14
+    plot_right = x + w * 0.97
+    plot_top = y + h * 0.14
+    plot_bottom = y + h * 0.86
+    plot_w = plot_right - plot_left
+
+    def y_for(value):
+        return plot_bottom - (value / top_value) * (plot_bottom - plot_top)
+
+    with pdf.local_context():
+        pdf.set_text_color(0, 0, 0)
+
+        pdf.set_font("Helvetica", 'B', 10)
+        title = f"{title} ({sum(counts)} {unit})"
+        pdf.text(x + (w - pdf.get_string_width(title)) / 2, y + h * 0.08, title)
+
+        # Integer grid lines, at most five of them
+        pdf.set_font("Helvetica", '', 7)
+        pdf.set_line_width(0.15)
+        pdf.set_draw_color(178, 178, 178)
+        pdf.set_dash_pattern(dash=1, gap=0.7)
+        step = max(1, int(top_value // 5) or 1)
+        for value in range(step, int(top_value) + 1, step):
+            tick_y = y_for(value)
+            pdf.line(plot_left, tick_y, plot_right, tick_y)
+            pdf.text(plot_left - 1.5 - pdf.get_string_width(str(value)), tick_y + 0.8, str(value))
+        pdf.set_dash_pattern()
+
+        slot_w = plot_w / len(AGGREGATE_LEVELS)
+        bar_w = slot_w * 0.5
+        for pos, (level, count) in enumerate(zip(AGGREGATE_LEVELS, counts)):
+            bar_x = plot_left + slot_w * pos + (slot_w - bar_w) / 2
+            bar_top = y_for(count)
+            pdf.set_fill_color(*RISK_RGB[level])
+            pdf.set_draw_color(0, 0, 0)
+            pdf.set_line_width(0.5)
+            if count > 0:
+                pdf.rect(bar_x, bar_top, bar_w, plot_bottom - bar_top, style="DF")
+            pdf.set_font("Helvetica", 'B', 8)
+            pdf.text(bar_x + (bar_w - pdf.get_string_width(str(count))) / 2, bar_top - 1, str(count))
+            pdf.set_font("Helvetica", '', 7)
+            pdf.text(bar_x + (bar_w - pdf.get_string_width(level)) / 2, plot_bottom + 3.5, level)
+
+        pdf.set_line_width(0.15)
+        pdf.line(plot_left, plot_top, plot_left, plot_bottom)
+        pdf.line(plot_left, plot_bottom, plot_right, plot_bottom)
+
+        pdf.set_font("Helvetica", 'B', 8)
+        y_label = unit.capitalize()
+        label_x = x + w * 0.04
+        label_y = plot_top + (plot_bottom - plot_top + pdf.get_string_width(y_label)) / 2
+        with pdf.rotation(90, label_x, label_y):
+            pdf.text(label_x, label_y, y_label)
+
+    return h
@@ -0,0 +1,109 @@
+import hashlib
+import json
+
+
+def normalize_rsid(rsid):
+    # rsIDs are matched case-insensitively and without surrounding whitespace
+    return str(rsid).strip().lower()
+
+
+def normalize_genotype(genotype):
+    # Unphased genotypes: "AG" and "ga" describe the same call
+    return "".join(sorted(str(genotype).strip().upper()))
+
+
+def row_key(record):
+    # A knowledge-base row is identified by its rsID and genotype
+    return normalize_rsid(record.get("SNP", "")), normalize_genotype(record.get("Genotype", ""))
+
+
+class SNPIndex:
+    """Hash indexes over the SNP knowledge base, built once at load time.
+
+    Lookups return record dicts in the same shape as
+    ``pd.DataFrame(snp_data).to_dict('records')``, so callers can hand them
+    straight to the UI loop and ``generate_pdf_report``.
+    """
+
+    def __init__(self, records, fingerprint=None):
+        self._by_rsid = {}
+        self._by_rsid_genotype = {}
+        for record in records:
+            record = dict(record)
+            key = row_key(record)
+            self._by_rsid.setdefault(key[0], []).append(record)
+            self._by_rsid_genotype.setdefault(key, []).append(record)
+        self._size = sum(len(v) for v in self._by_rsid.values())
+        self._fingerprint = fingerprint
+
+    def updated(self, removed_keys, added_records, fingerprint=None):
+        """Return a new index with the rows under ``removed_keys`` dropped and ``added_records`` added.
+
+        Only the rsIDs touched by the change are re-indexed; every other entry is
+        shared with this index, which is left unchanged for anyone still reading it.
+        """
+        removed = set(removed_keys)
+        by_rsid = dict(self._by_rsid)
+        by_rsid_genotype = dict(self._by_rsid_genotype)
+        size = self._size
+        for key in removed:
+            size -= len(by_rsid_genotype.pop(key, ()))
+
+        added_by_rsid = {}
+        for record in added_records:
+            record = dict(record)
+            key = row_key(record)
+            by_rsid_genotype[key] = by_rsid_genotype.get(key, []) + [record]
+            added_by_rsid.setdefault(key[0], []).append(record)
+            size += 1
+
+        for rsid in {key[0] for key in removed} | added_by_rsid.keys():
+            group = [r for r in self._by_rsid.get(rsid, ()) if row_key(r) not in removed]
+            group += added_by_rsid.get(rsid, [])
+            if group:
+                by_rsid[rsid] = group
+            else:
+                by_rsid.pop(rsid, None)
+
+        index = SNPIndex((), fingerprint)
+        index._by_rsid, index._by_rsid_genotype, index._size = by_rsid, by_rsid_genotype, size
+        return index
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, rsid):
+        return normalize_rsid(rsid) in self._by_rsid
+
+    def rsids(self):
+        return self._by_rsid.keys()
+
+    def fingerprint(self):
+        # Content hash of the knowledge base, so caches can tell when it changed
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            for record in self.records():
+                digest.update(json.dumps(record, sort_keys=True).encode("utf-8"))
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def records(self):
+        for group in self._by_rsid.values():
+            for record in group:
+                yield dict(record)
+
+    def lookup(self, rsid):
+        # Copies keep the indexed records safe from callers that mutate results
+        return [dict(r) for r in self._by_rsid.get(normalize_rsid(rsid), ())]
+
+    def lookup_genotype(self, rsid, genotype):
+        key = (normalize_rsid(rsid), normalize_genotype(genotype))
+        return [dict(r) for r in self._by_rsid_genotype.get(key, ())]
+
+
+def build_default_index():
+    # The same file the app and the API serve (NUTRIGENE_KB_FILE, else snp_data.py),
+    # read from the compiled knowledge base (see snp_kb.py) when it matches that file
+    from kb_reload import DEFAULT_SOURCE, load_index
+
+    return load_index(DEFAULT_SOURCE)
@@ -0,0 +1,255 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+from snp_index import normalize_genotype, normalize_rsid
+
+DEFAULT_KB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snp_kb.sqlite")
+
+# Column order of the records in snp_data; lookups rebuild dicts in this order. Any other
+# record (extra keys, non-text values or another key order) is kept whole as JSON instead
+FIELDS = (
+    "SNP", "Gene Name", "Genotype", "Effect", "Nutrient",
+    "Recommendation", "Local Food Recommendations (Pakistani)", "Risk Level",
+)
+RISK_LEVEL_CODES = {"UNKNOWN": 0, "Low": 1, "Medium": 2, "High": 3}
+# Bumped when the schema changes; files compiled by an older version are treated as stale
+COMPILED_FORMAT = "2"
+
+# Pages are memory-mapped, so the OS shares them between processes and
+# nothing beyond what lookups touch becomes resident
+MMAP_SIZE = 1 << 30
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE text_values (id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE);
+CREATE TABLE nutrients (code INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE risk_levels (code INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE variants (
+    id INTEGER PRIMARY KEY,
+    rsid TEXT NOT NULL,
+    genotype_key TEXT NOT NULL,
+    snp TEXT,
+    genotype TEXT,
+    gene_id INTEGER REFERENCES text_values(id),
+    effect_id INTEGER REFERENCES text_values(id),
+    nutrient_code INTEGER REFERENCES nutrients(code),
+    recommendation_id INTEGER REFERENCES text_values(id),
+    local_food_id INTEGER REFERENCES text_values(id),
+    risk_code INTEGER REFERENCES risk_levels(code),
+    record_json TEXT
+);
+"""
+_INDEXES = """
+CREATE INDEX variants_rsid ON variants (rsid);
+CREATE INDEX variants_rsid_genotype ON variants (rsid, genotype_key);
+"""
+
+_SELECT_ROWS = (
+    "SELECT snp, gene_id, genotype, effect_id, nutrient_code, recommendation_id, local_food_id, risk_code,"
+    " record_json FROM variants"
+)
+
+
+def _fits_columns(record):
+    # True when the FIELDS columns rebuild ``record`` exactly, keys and key order included
+    return list(record) == [field for field in FIELDS if field in record] and all(
+        isinstance(value, str) for value in record.values()
+    )
+
+
+def compile_knowledge_base(records, path=DEFAULT_KB_PATH, source_digest=None):
+    """Compile knowledge-base records (the ``snp_data`` shape) into a compact SQLite file.
+
+    ``source_digest`` (the sha256 of the data file the records came from) is stored
+    so loaders can tell whether the compiled file still matches that file.
+    """
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(_SCHEMA)
+        text_ids, nutrient_codes = {}, {}
+        risk_codes = dict(RISK_LEVEL_CODES)
+
+        def text_id(value):
+            if value is None:
+                return None
+            if value not in text_ids:
+                text_ids[value] = len(text_ids) + 1
+            return text_ids[value]
+
+        rows = []
+        for record in records:
+            nutrient = record.get("Nutrient")
+            if nutrient is not None and nutrient not in nutrient_codes:
+                nutrient_codes[nutrient] = len(nutrient_codes) + 1
+            risk = record.get("Risk Level")
+            if risk is not None and risk not in risk_codes:
+                risk_codes[risk] = max(risk_codes.values()) + 1
+            rows.append((
+                normalize_rsid(record.get("SNP", "")),
+                normalize_genotype(record.get("Genotype", "")),
+                record.get("SNP"),
+                record.get("Genotype"),
+                text_id(record.get("Gene Name")),
+                text_id(record.get("Effect")),
+                nutrient_codes.get(nutrient),
+                text_id(record.get("Recommendation")),
+                text_id(record.get("Local Food Recommendations (Pakistani)")),
+                risk_codes.get(risk),
+                None if _fits_columns(record) else json.dumps(record, ensure_ascii=False),
+            ))
+
+        conn.execute("INSERT INTO meta VALUES ('format', ?)", (COMPILED_FORMAT,))
+        if source_digest is not None:
+            conn.execute("INSERT INTO meta VALUES ('source_digest', ?)", (source_digest,))
+        conn.executemany("INSERT INTO text_values VALUES (?, ?)", ((i, v) for v, i in text_ids.items()))
+        conn.executemany("INSERT INTO nutrients VALUES (?, ?)", ((c, n) for n, c in nutrient_codes.items()))
+        conn.executemany("INSERT INTO risk_levels VALUES (?, ?)", ((c, n) for n, c in risk_codes.items()))
+        conn.executemany(
+            "INSERT INTO variants (rsid, genotype_key, snp, genotype, gene_id, effect_id, nutrient_code,"
+            " recommendation_id, local_food_id, risk_code, record_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.executescript(_INDEXES)
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return len(rows)
+
+
+class CompactSNPIndex:
+    """Read-only view over a compiled knowledge base with the same API as ``SNPIndex``.
+
+    Only the rsID set and the deduplicated lookup tables are held in memory;
+    variant rows are read from the memory-mapped database on lookup.
+    """
+
+    def __init__(self, path=DEFAULT_KB_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        self._rsids = frozenset(row[0] for row in conn.execute("SELECT DISTINCT rsid FROM variants"))
+        self._size = conn.execute("SELECT COUNT(*) FROM variants").fetchone()[0]
+        self._text = dict(conn.execute("SELECT id, value FROM text_values"))
+        self._nutrients = dict(conn.execute("SELECT code, name FROM nutrients"))
+        self._risk_levels = dict(conn.execute("SELECT code, name FROM risk_levels"))
+        # Same fingerprint as the data file it was compiled from, so report caches are shared
+        self._fingerprint = _source_digest(conn)
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+            self._local.conn = conn
+        return conn
+
+    def _to_record(self, row):
+        snp, gene_id, genotype, effect_id, nutrient_code, recommendation_id, local_food_id, risk_code, record_json = row
+        if record_json is not None:
+            return json.loads(record_json)
+        text = self._text
+        values = (
+            snp, text.get(gene_id), genotype, text.get(effect_id), self._nutrients.get(nutrient_code),
+            text.get(recommendation_id), text.get(local_food_id), self._risk_levels.get(risk_code),
+        )
+        return {field: value for field, value in zip(FIELDS, values) if value is not None}
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, rsid):
+        return normalize_rsid(rsid) in self._rsids
+
+    def rsids(self):
+        return self._rsids
+
+    def fingerprint(self):
+        # Otherwise the compiled file is immutable once written, so its bytes identify the content
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            with open(self.path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def records(self):
+        for row in self._connection().execute(_SELECT_ROWS + " ORDER BY id"):
+            yield self._to_record(row)
+
+    def lookup(self, rsid):
+        rsid = normalize_rsid(rsid)
+        if rsid not in self._rsids:
+            return []
+        rows = self._connection().execute(_SELECT_ROWS + " WHERE rsid = ? ORDER BY id", (rsid,))
+        return [self._to_record(row) for row in rows]
+
+    def lookup_genotype(self, rsid, genotype):
+        rsid = normalize_rsid(rsid)
+        if rsid not in self._rsids:
+            return []
+        rows = self._connection().execute(
+            _SELECT_ROWS + " WHERE rsid = ? AND genotype_key = ? ORDER BY id",
+            (rsid, normalize_genotype(genotype)),
+        )
+        return [self._to_record(row) for row in rows]
+
+
+def _source_digest(conn):
+    try:
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+    except sqlite3.OperationalError:
+        return None # compiled before the digest was recorded
+    # A file in an older format cannot be read back faithfully, so it matches no source
+    return meta.get("source_digest") if meta.get("format") == COMPILED_FORMAT else None
+
+
+def compiled_source_digest(path=DEFAULT_KB_PATH):
+    """Digest of the data file ``path`` was compiled from, or None if unknown or missing."""
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return _source_digest(conn)
+    except sqlite3.DatabaseError:
+        return None
+    finally:
+        conn.close()
+
+
+def is_compiled_kb_current(path=DEFAULT_KB_PATH, source_path=None):
+    # Trusted only when compiled from the current content of the source file; mtimes lie across copies and checkouts
+    from kb_reload import DEFAULT_SOURCE, file_digest
+
+    digest = compiled_source_digest(path)
+    return digest is not None and digest == file_digest(source_path or DEFAULT_SOURCE)
+
+
+def main(argv=None):
+    from kb_reload import DEFAULT_SOURCE, load_source
+
+    parser = argparse.ArgumentParser(description="Compile the knowledge base into the compact NutriGene file.")
+    parser.add_argument("-o", "--output", default=DEFAULT_KB_PATH, help="Path of the compiled SQLite file")
+    parser.add_argument("--source", default=DEFAULT_SOURCE,
+                        help="Knowledge-base file (.py, .json or .jsonl) to compile; defaults to NUTRIGENE_KB_FILE or snp_data.py")
+    args = parser.parse_args(argv)
+
+    records, digest = load_source(args.source)
+    count = compile_knowledge_base(records, args.output, digest)
+    print(f"Compiled {count} records from {args.source} into {args.output} ({os.path.getsize(args.output)} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
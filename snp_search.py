@@ -0,0 +1,84 @@
+import re
+from bisect import bisect_left
+from collections import namedtuple
+
+from snp_index import normalize_rsid
+
+# Fields searched, in the order their matches are ranked
+SEARCH_FIELDS = ("SNP", "Gene Name", "Nutrient")
+
+_WORD_SPLIT = re.compile(r"[^0-9a-z]+")
+
+Suggestion = namedtuple("Suggestion", ["kind", "value", "rsids"])
+
+
+class PrefixSearchIndex:
+    """Type-ahead search over rsIDs, gene names and nutrients.
+
+    Every searchable key (the whole value, plus each word of multi-word values
+    such as ``Vitamin B12``) is kept in one sorted array, so a query is a
+    ``bisect`` to the first key with its prefix and a short scan from there.
+    """
+
+    def __init__(self, records):
+        entries = {}
+        for record in records:
+            rsid = normalize_rsid(record.get("SNP", ""))
+            for kind in SEARCH_FIELDS:
+                value = rsid if kind == "SNP" else str(record.get(kind, "")).strip()
+                if value:
+                    # A dict keeps first-seen order and drops repeats in O(1)
+                    entries.setdefault((kind, value), {})[rsid] = None
+
+        self._suggestions = []
+        keys = []
+        for (kind, value), rsids in entries.items():
+            entry = len(self._suggestions)
+            self._suggestions.append(Suggestion(kind, value, tuple(rsids)))
+            folded = value.lower()
+            keys.append((folded, True, entry))
+            for word in set(_WORD_SPLIT.split(folded)):
+                if word and word != folded:
+                    keys.append((word, False, entry))
+        keys.sort()
+        self._keys = [key for key, _, _ in keys]
+        self._matches = [(whole, entry) for _, whole, entry in keys]
+
+    def __len__(self):
+        return len(self._suggestions)
+
+    def search(self, query, limit=10):
+        """Return up to ``limit`` suggestions whose value (or a word of it) starts with ``query``.
+
+        Exact matches rank first, then rsIDs, genes and nutrients, then whole-value
+        matches before single-word ones and shorter values before longer ones.
+        """
+        prefix = str(query).strip().lower()
+        if not prefix or limit <= 0:
+            return []
+        # Keys sharing the prefix are contiguous; only a bounded window of them is ranked
+        window = max(limit * 8, 64)
+        start = bisect_left(self._keys, prefix)
+        ranked = {}
+        for pos in range(start, min(start + window, len(self._keys))):
+            key = self._keys[pos]
+            if not key.startswith(prefix):
+                break
+            whole, entry = self._matches[pos]
+            suggestion = self._suggestions[entry]
+            rank = (key != prefix, SEARCH_FIELDS.index(suggestion.kind), not whole, len(suggestion.value), suggestion.value)
+            if entry not in ranked or rank < ranked[entry]:
+                ranked[entry] = rank
+        best = sorted(ranked, key=ranked.get)[:limit]
+        return [self._suggestions[entry] for entry in best]
+
+    def search_rsids(self, query, limit=10):
+        """rsIDs behind the top suggestions for ``query``, best first and without repeats."""
+        # A gene or nutrient can stand for thousands of rsIDs, so stop once ``limit`` are collected
+        rsids = {}
+        for suggestion in self.search(query, limit):
+            for rsid in suggestion.rsids:
+                rsids[rsid] = None
+                if len(rsids) == limit:
+                    return list(rsids)
+        return list(rsids)
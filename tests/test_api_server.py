@@ -0,0 +1,137 @@
+import http.client
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+import api_server
+from api_server import NutriGeneServer
+from kb_reload import DEFAULT_SOURCE, KnowledgeBaseWatcher
+from report_cache import ReportCache
+
+RAW_FILE = b"# rsid\tchromosome\tposition\tgenotype\nrs1801133\t1\t11856378\tTT\nrs999999999\t1\t1\tAA\n"
+
+
+@pytest.fixture
+def start_server(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_server, "ReportCache", lambda fingerprint: ReportCache(fingerprint, str(tmp_path)))
+    knowledge_base = KnowledgeBaseWatcher(DEFAULT_SOURCE)
+    servers = []
+
+    def start(workers=2, queue_size=2):
+        server = NutriGeneServer(("127.0.0.1", 0), knowledge_base, workers, queue_size)
+        threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def connect(server):
+    return http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=5)
+
+
+def raw_socket(server):
+    return socket.create_connection(("127.0.0.1", server.server_port), timeout=5)
+
+
+def read_response(f):
+    """Status, headers and body of the next response on a socket's file, leaving later ones unread."""
+    status = int(f.readline().split()[1])
+    headers = {}
+    for line in iter(f.readline, b"\r\n"):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, headers, f.read(int(headers.get("content-length", 0)))
+
+
+def get_json(conn, method, path, body=None, headers=None):
+    conn.request(method, path, body, headers or {})
+    response = conn.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def get_when_free(conn, path, wait=2.0):
+    # A slot is freed just after its response is written, so a client that is quicker than
+    # that may see one 503; an idle connection still holding a slot would keep causing them
+    deadline = time.monotonic() + wait
+    while True:
+        status = get_json(conn, "GET", path)[0]
+        if status != 503 or time.monotonic() > deadline:
+            return status
+        time.sleep(0.05)
+
+
+def test_json_endpoints(start_server):
+    conn = connect(start_server())
+    # All on one keep-alive connection, which goes back to the watcher between requests
+    status, payload = get_json(conn, "GET", "/health")
+    assert status == 200 and payload["status"] == "ok" and payload["records"] > 0
+    status, payload = get_json(conn, "GET", "/snp/RS1801133")
+    assert status == 200 and payload["snp"] == "rs1801133" and payload["records"]
+    status, payload = get_json(conn, "GET", "/snp/rs1801133?genotype=tt")
+    assert status == 200 and {r["Genotype"] for r in payload["records"]} == {"TT"}
+    assert get_json(conn, "GET", "/snp/rs1")[0] == 404
+    status, payload = get_json(conn, "POST", "/panel", json.dumps({"panel": "rs1801133 TT\nrs1"}),
+                               {"Content-Type": "application/json"})
+    assert status == 200 and payload["unmatched"] == ["rs1"] and payload["records"]
+    status, payload = get_json(conn, "POST", "/analyze", RAW_FILE)
+    assert status == 200 and [r["SNP"].lower() for r in payload["records"]] == ["rs1801133"]
+    assert get_json(conn, "GET", "/nowhere")[0] == 404
+
+
+def test_pdf_endpoints(start_server):
+    conn = connect(start_server())
+    for method, path, body, headers in [
+        ("GET", "/snp/rs1801133?format=pdf", None, {}),
+        ("GET", "/snp/rs1801133", None, {"Accept": "application/pdf"}),
+        ("POST", "/panel?format=pdf", "rs1801133 TT", {}),
+        ("POST", "/analyze?format=pdf", RAW_FILE, {}),
+    ]:
+        conn.request(method, path, body, headers)
+        response = conn.getresponse()
+        assert response.status == 200 and response.getheader("Content-Type") == "application/pdf"
+        assert response.read().startswith(b"%PDF")
+
+
+def test_rejects_with_503_once_workers_and_queue_are_taken(start_server):
+    server = start_server(workers=1, queue_size=1)
+    # Two requests stalled mid-headers: one holds the worker, the other its queue slot
+    stalled = [raw_socket(server) for _ in range(2)]
+    for sock in stalled:
+        sock.sendall(b"GET /health HTTP/1.1\r\nHost: test\r\n")
+    busy = raw_socket(server)
+    busy.sendall(b"GET /health HTTP/1.1\r\nHost: test\r\n\r\n")
+    status, headers, body = read_response(busy.makefile("rb"))
+    assert status == 503 and headers["retry-after"] == "1" and "busy" in json.loads(body)["error"]
+
+    for sock in stalled:
+        sock.sendall(b"Connection: close\r\n\r\n")
+        assert read_response(sock.makefile("rb"))[0] == 200
+    assert get_when_free(connect(server), "/health") == 200 # slots are free again
+
+
+def test_idle_keep_alive_connections_hold_no_slot(start_server):
+    server = start_server(workers=1, queue_size=0)
+    idle = [connect(server) for _ in range(3)]
+    for conn in idle:
+        assert get_when_free(conn, "/health") == 200 # each left open and idle
+    for conn in idle:
+        assert get_when_free(conn, "/snp/rs1801133") == 200
+
+
+def test_pipelined_requests_are_all_answered(start_server):
+    server = start_server(workers=1, queue_size=0)
+    sock = raw_socket(server)
+    sock.sendall(b"GET /health HTTP/1.1\r\nHost: test\r\n\r\n"
+                 b"GET /snp/rs1801133 HTTP/1.1\r\nHost: test\r\n\r\n"
+                 b"GET /snp/rs1 HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n")
+    f = sock.makefile("rb")
+    statuses = [read_response(f)[0] for _ in range(3)]
+    assert statuses == [200, 200, 404]
+    assert f.read() == b"" # closed after the last one
@@ -0,0 +1,36 @@
+import pytest
+
+from batch_report import collect_samples, main
+
+
+def touch(path):
+    path.write_text("# rsid\tchromosome\tposition\tgenotype\n")
+    return path
+
+
+def test_directory_samples_are_named_after_their_files(tmp_path):
+    touch(tmp_path / "a.txt")
+    touch(tmp_path / "b.vcf.gz")
+    touch(tmp_path / "notes.md")
+    assert collect_samples(str(tmp_path)) == [("a", str(tmp_path / "a.txt")), ("b", str(tmp_path / "b.vcf.gz"))]
+
+
+def test_files_that_would_share_a_sample_id_are_refused(tmp_path, capsys):
+    touch(tmp_path / "a.txt")
+    touch(tmp_path / "a.vcf")
+    with pytest.raises(ValueError, match="duplicate sample IDs.*a.txt.*a.vcf"):
+        collect_samples(str(tmp_path))
+    assert main([str(tmp_path), "-o", str(tmp_path / "reports")]) == 1
+    assert "duplicate sample IDs" in capsys.readouterr().err
+    assert not (tmp_path / "reports").exists()
+
+
+def test_manifest_ids_must_be_unique(tmp_path):
+    touch(tmp_path / "x.txt")
+    touch(tmp_path / "y.txt")
+    manifest = tmp_path / "samples.csv"
+    manifest.write_text("sample_id,path\nS1,x.txt\ns1,y.txt\n")
+    with pytest.raises(ValueError, match="S1"):
+        collect_samples(str(manifest))
+    manifest.write_text("sample_id,path\nS1,x.txt\nS2,x.txt\n")
+    assert [sample_id for sample_id, _ in collect_samples(str(manifest))] == ["S1", "S2"]
@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+from cohort import (BYTES_PER_CALL, CALL_CATEGORIES, CATEGORY_INDEX, FIRST_KNOWN, NO_CALL, NOT_IN_KB, Cohort,
+                    CohortLayout, analyze_cohort, build_cohort, default_chunk_rows)
+from nutrigene_core import generate_cohort_report
+from snp_index import SNPIndex
+
+
+def record(rsid, genotype, risk, nutrient):
+    return {"SNP": rsid, "Gene Name": f"G{rsid}", "Genotype": genotype, "Effect": "", "Nutrient": nutrient,
+            "Recommendation": "", "Risk Level": risk}
+
+
+RECORDS = [
+    record("rs1", "AA", "High", "Folate"), record("rs1", "AG", "Medium", "Folate"),
+    record("rs1", "GG", "Low", "Folate"),
+    record("rs2", "CC", "High", "Iron"), record("rs2", "CT", "High", "Vitamin D"),
+    record("rs3", "TT", "UNKNOWN", "Iron"), record("rs3", "AT", "Low", "Caffeine"),
+    record("rs4", "GG", "High", "Vitamin D"),
+]
+
+
+@pytest.fixture
+def layout():
+    return CohortLayout.from_index(SNPIndex(RECORDS))
+
+
+def naive_category(layout, j, code):
+    if code == NO_CALL:
+        return "No call"
+    if code == NOT_IN_KB:
+        return "Not in KB"
+    level = layout.risk_levels[j][code - FIRST_KNOWN]
+    return level if level in CATEGORY_INDEX else "Not in KB"
+
+
+def naive_nutrient(layout, j, code):
+    names = layout.nutrients[j]
+    return names[0] if code < FIRST_KNOWN else names[code - FIRST_KNOWN]
+
+
+def naive_summary(layout, matrix):
+    n_levels = len(CALL_CATEGORIES)
+    per_sample = np.zeros((len(matrix), n_levels), dtype=np.int64)
+    per_snp = np.zeros((len(layout.rsids), n_levels), dtype=np.int64)
+    per_nutrient = np.zeros((len(layout.nutrient_names), n_levels), dtype=np.int64)
+    high_samples = np.zeros(len(layout.nutrient_names), dtype=np.int64)
+    for i, row in enumerate(matrix.tolist()):
+        high_nutrients = set()
+        for j, code in enumerate(row):
+            category = CATEGORY_INDEX[naive_category(layout, j, code)]
+            nutrient = layout.nutrient_names.index(naive_nutrient(layout, j, code))
+            per_sample[i, category] += 1
+            per_snp[j, category] += 1
+            per_nutrient[nutrient, category] += 1
+            if category == CATEGORY_INDEX["High"]:
+                high_nutrients.add(nutrient)
+        for nutrient in high_nutrients:
+            high_samples[nutrient] += 1
+    return per_sample, per_snp, per_nutrient, high_samples
+
+
+def random_cohort(tmp_path, layout, n_samples, seed=0):
+    rng = np.random.default_rng(seed)
+    matrix = Cohort.create(str(tmp_path / "cohort"), layout, [f"s{i}" for i in range(n_samples)])
+    for j, genotypes in enumerate(layout.genotypes):
+        matrix[:, j] = rng.integers(0, len(genotypes) + FIRST_KNOWN, n_samples)
+    matrix.flush()
+    del matrix
+    return Cohort(str(tmp_path / "cohort"))
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 7, 64, 1000, None])
+def test_analyze_cohort_matches_naive_count(tmp_path, layout, chunk_rows):
+    cohort = random_cohort(tmp_path, layout, 200)
+    summary = analyze_cohort(cohort, chunk_rows)
+    per_sample, per_snp, per_nutrient, high_samples = naive_summary(layout, np.asarray(cohort.matrix))
+
+    np.testing.assert_array_equal(summary.per_sample, per_sample)
+    np.testing.assert_array_equal(summary.per_snp, per_snp)
+    np.testing.assert_array_equal(summary.per_nutrient, per_nutrient)
+    np.testing.assert_array_equal(summary.nutrient_high_samples, high_samples)
+    assert sum(summary.risk_counts().values()) == 200 * len(layout.rsids)
+
+
+def test_default_chunk_rows_follow_the_byte_budget():
+    assert default_chunk_rows(10_000, 64 << 20) * 10_000 * BYTES_PER_CALL <= 64 << 20
+    assert default_chunk_rows(10 ** 9, 64 << 20) == 1
+
+
+def test_encode_separates_missing_calls_from_unlisted_genotypes(layout):
+    row = layout.encode([("rs1", "GA"), ("rs2", "GG"), ("rs3", "TT")])
+    columns = layout.columns
+    assert naive_category(layout, columns["rs1"], row[columns["rs1"]]) == "Medium" # genotype order is normalised
+    assert row[columns["rs2"]] == NOT_IN_KB
+    assert naive_category(layout, columns["rs3"], row[columns["rs3"]]) == "Not in KB" # listed without a rating
+    assert row[columns["rs4"]] == NO_CALL
+
+
+def test_cohort_rejects_older_format(tmp_path, layout):
+    cohort = random_cohort(tmp_path, layout, 3)
+    path = cohort.base_path + ".json"
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text.replace('"format": 2, ', ""))
+    with pytest.raises(ValueError):
+        Cohort(cohort.base_path)
+
+
+def test_unreadable_sample_is_reported_and_left_as_no_calls(tmp_path, capsys):
+    sample = tmp_path / "ok.txt"
+    sample.write_text("# rsid\tchromosome\tposition\tgenotype\nrs1\t1\t100\tAG\nrs2\t1\t200\tGG\n")
+    samples = [("ok", str(sample)), ("gone", str(tmp_path / "missing.txt"))]
+    cohort = build_cohort(samples, str(tmp_path / "cohort"), SNPIndex(RECORDS), workers=1)
+
+    assert "FAILED gone: FileNotFoundError" in capsys.readouterr().err
+    assert cohort.failed == ["gone"] and Cohort(cohort.base_path).failed == ["gone"]
+    assert not np.asarray(cohort.matrix[1]).any()
+    summary = analyze_cohort(cohort)
+    assert summary.per_sample[0, CATEGORY_INDEX["Medium"]] == 1 and summary.per_sample[0, NOT_IN_KB] == 1
+    assert summary.per_sample[1, CATEGORY_INDEX["No call"]] == len(cohort.layout.rsids)
+    assert generate_cohort_report(summary).getvalue().startswith(b"%PDF")
@@ -0,0 +1,75 @@
+import gzip
+import io
+
+import pytest
+
+from genotype_parser import iter_genotype_calls, iter_lines
+
+TWENTY_THREE_AND_ME = (
+    b"# rsid\tchromosome\tposition\tgenotype\r\n"
+    b"rs1801133\t1\t11856378\tAG\r\n"
+    b"rs4988235\t2\t136608646\t--\r\n"
+    b"rs762551\t15\t75041917\tAA\r\n"
+    b"rs0000001\t1\t1\tCC\r\n"
+    b"rs9939609\t16\t53820527\tTA"
+)
+ANCESTRY = (
+    b"#AncestryDNA raw data\n"
+    b"rsid\tchromosome\tposition\tallele1\tallele2\n"
+    b"rs1801133\t1\t11856378\tA\tG\n"
+    b"rs4988235\t2\t136608646\t0\t0\n"
+    b"rs762551\t15\t75041917\tA\tA\n"
+)
+VCF = (
+    b"##fileformat=VCFv4.2\n"
+    b"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\tS2\n"
+    b"1\t11856378\trs1801133\tG\tA\t.\tPASS\t.\tGT\t0/1\t1|1\n"
+    b"2\t136608646\trs4988235\tC\tT\t.\tPASS\t.\tGT:DP\t./.:3\t0/0:9\n"
+    b"15\t75041917\trs762551;rs0\tA\tC\t.\tPASS\t.\tGT\t0/0\t0/1\n"
+)
+WANTED = ["rs1801133", "rs4988235", "rs762551", "rs9939609"]
+
+
+def calls(data, chunk_size, **kwargs):
+    return list(iter_genotype_calls(io.BytesIO(data), WANTED, chunk_size=chunk_size, **kwargs))
+
+
+@pytest.mark.parametrize("data", [TWENTY_THREE_AND_ME, ANCESTRY, VCF])
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 16, 64])
+def test_chunk_boundaries_do_not_change_calls(data, chunk_size):
+    assert calls(data, chunk_size) == calls(data, 1 << 20)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 20])
+def test_iter_lines_matches_splitlines(chunk_size):
+    data = b"a\nbb\n\nccc\r\nd"
+    assert list(iter_lines(io.BytesIO(data), chunk_size)) == data.split(b"\n")
+
+
+def test_raw_calls_skip_no_calls_and_unknown_rsids():
+    assert calls(TWENTY_THREE_AND_ME, 1 << 20) == [("rs1801133", "AG"), ("rs762551", "AA"), ("rs9939609", "TA")]
+    assert calls(ANCESTRY, 1 << 20) == [("rs1801133", "AG"), ("rs762551", "AA")]
+
+
+def test_vcf_sample_column():
+    assert calls(VCF, 1 << 20) == [("rs1801133", "GA"), ("rs762551", "AA")]
+    assert calls(VCF, 1 << 20, sample="S2") == [("rs1801133", "AA"), ("rs4988235", "CC"), ("rs762551", "AC")]
+    with pytest.raises(ValueError):
+        calls(VCF, 1 << 20, sample="S3")
+
+
+@pytest.mark.parametrize("chunk_size", [3, 1 << 20])
+def test_csv_rows_with_quoted_fields(chunk_size):
+    data = (
+        b'RSID,CHROMOSOME,POSITION,RESULT\r\n'
+        b'"rs1801133","1","11856378","AG"\r\n'
+        b'"rs4988235","2","136608646","--"\r\n'
+        b'rs762551,15,75041917,AA\r\n'
+    )
+    assert calls(data, chunk_size) == [("rs1801133", "AG"), ("rs762551", "AA")]
+    ancestry_csv = b"rsid,chromosome,position,allele1,allele2\nrs1801133,1,11856378,A,G\n"
+    assert calls(ancestry_csv, chunk_size) == [("rs1801133", "AG")]
+
+
+def test_gzip_input_matches_plain():
+    assert calls(gzip.compress(TWENTY_THREE_AND_ME), 5) == calls(TWENTY_THREE_AND_ME, 1 << 20)
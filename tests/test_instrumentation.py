@@ -0,0 +1,33 @@
+import json
+import logging
+
+import instrumentation
+from instrumentation import budget_logger, record_budget
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_budget_overruns_are_reported_without_logging_configured(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrumentation, "METRICS_FILE", str(tmp_path / "metrics.jsonl"))
+    handler = ListHandler()
+    budget_logger.addHandler(handler)
+    try:
+        record_budget("rerun", 250.0, 200)
+        record_budget("rerun", 50.0, 200)
+    finally:
+        budget_logger.removeHandler(handler)
+
+    # Not routed to the NullHandler of the "nutrigene" logger: it has a stderr handler of its own
+    assert not budget_logger.propagate and any(isinstance(h, logging.StreamHandler) for h in budget_logger.handlers)
+    assert handler.messages == ["rerun took 250.0 ms (budget 200 ms)"]
+    with open(tmp_path / "metrics.jsonl", encoding="utf-8") as f:
+        exported = [json.loads(line) for line in f]
+    assert [(m["request"], m["total_ms"], m["labels"]["over_budget"]) for m in exported] == \
+        [("rerun", 250.0, True), ("rerun", 50.0, False)]
@@ -0,0 +1,150 @@
+import itertools
+import json
+import os
+import random
+
+import pytest
+
+import kb_reload
+from benchmarks.synthetic_data import generate_knowledge_base
+from kb_reload import KnowledgeBaseWatcher, parse_source, write_jsonl
+from snp_index import SNPIndex, build_default_index, row_key
+from snp_kb import compile_knowledge_base
+
+# Each write moves the file's mtime forward by a second, so no two writes share a stamp
+_ticks = itertools.count(1)
+
+
+def state(index):
+    """Everything a lookup can return, independent of record order within a row."""
+    return {
+        rsid: sorted(json.dumps(r, sort_keys=True) for r in index.lookup(rsid))
+        for rsid in index.rsids()
+    }
+
+
+def rebuild(records):
+    return state(SNPIndex(records))
+
+
+def edit(records, rng):
+    """A random curator edit: changed, deleted, added and duplicated rows."""
+    records = [dict(r) for r in records]
+    for _ in range(3):
+        rng.choice(records)["Risk Level"] = rng.choice(["Low", "Medium", "High"])
+    for _ in range(2):
+        records.pop(rng.randrange(len(records)))
+    new = dict(rng.choice(records), SNP=f"rs{rng.randint(1, 10**9)}")
+    records.insert(rng.randrange(len(records)), new)
+    # A second row under an existing (rsID, genotype) key
+    records.append(dict(rng.choice(records), Recommendation=f"Variant {rng.random()}"))
+    return records
+
+
+def write(path, records, layout):
+    if layout == "jsonl":
+        write_jsonl(records, path)
+    elif layout == "json":
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(records, f, indent=1)
+    elif layout == "py":
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("snp_data = [\n" + "".join(f"    {r!r},\n" for r in records) + "]\n")
+    else: # one field per line, as a hand-formatted file might be
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("snp_data = [\n")
+            for r in records:
+                f.write("    {\n" + "".join(f"        {k!r}: {v!r},\n" for k, v in r.items()) + "    },\n")
+            f.write("]\n")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + next(_ticks) * 1_000_000_000))
+
+
+def test_updated_matches_rebuild():
+    rng = random.Random(1)
+    records = generate_knowledge_base(300)
+    index = SNPIndex(records)
+    before = state(index)
+    for _ in range(20):
+        keys = {row_key(r) for r in rng.sample(records, 10)}
+        added = [dict(rng.choice(records), Effect=f"edited {rng.random()}") for _ in range(5)]
+        added += [dict(rng.choice(records), SNP=f"rs{rng.randint(1, 10**9)}") for _ in range(3)]
+        new_records = [r for r in records if row_key(r) not in keys] + added
+        updated = index.updated(keys, added)
+        assert state(updated) == rebuild(new_records)
+        assert len(updated) == len(new_records)
+        assert state(index) == before # the old snapshot is untouched
+
+
+@pytest.mark.parametrize("layout", ["jsonl", "py", "json", "py-multiline"])
+def test_watcher_matches_fresh_load(tmp_path, layout):
+    rng = random.Random(layout)
+    path = str(tmp_path / ("kb." + layout.split("-")[0]))
+    records = generate_knowledge_base(200)
+    write(path, records, layout)
+    watcher = KnowledgeBaseWatcher(path)
+    assert state(watcher.snapshot()) == rebuild(records)
+    for _ in range(10):
+        records = edit(records, rng)
+        write(path, records, layout)
+        old = watcher.snapshot()
+        old_state = state(old)
+        change = watcher.check()
+        assert change is not None
+        assert state(watcher.snapshot()) == rebuild(records)
+        with open(path, "rb") as f:
+            assert state(watcher.snapshot()) == rebuild(parse_source(path, f.read()))
+        assert state(old) == old_state
+
+
+def test_diff_lines_reports_only_changed_rows(tmp_path):
+    path = str(tmp_path / "kb.jsonl")
+    records = generate_knowledge_base(50)
+    write(path, records, "jsonl")
+    watcher = KnowledgeBaseWatcher(path)
+    records[10] = dict(records[10], Effect="Edited")
+    write(path, records[::-1], "jsonl") # reordered as well: moves are not changes
+    change = watcher.check()
+    assert change.removed_keys == [row_key(records[10])]
+    assert change.added_records == [records[10]]
+
+
+def test_broken_file_keeps_last_good_version(tmp_path):
+    path = str(tmp_path / "kb.py")
+    records = generate_knowledge_base(20)
+    write(path, records, "py")
+    watcher = KnowledgeBaseWatcher(path)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("    {'SNP': 'rs1', 'Genotype'\n")
+    os.utime(path, ns=(0, 1))
+    assert watcher.check() is None
+    assert state(watcher.snapshot()) == rebuild(records)
+
+
+def test_compiled_knowledge_base_is_used_and_reloaded(tmp_path, monkeypatch):
+    path = str(tmp_path / "kb.py")
+    kb_path = str(tmp_path / "kb.sqlite")
+    records = generate_knowledge_base(100)
+    write(path, records, "py")
+    with open(path, "rb") as f:
+        records_on_disk, digest = parse_source(path, f.read()), kb_reload.file_digest(path)
+    compile_knowledge_base(records_on_disk, kb_path, digest)
+    monkeypatch.setattr(kb_reload, "DEFAULT_KB_PATH", kb_path)
+
+    watcher = KnowledgeBaseWatcher(path)
+    assert type(watcher.snapshot()).__name__ == "CompactSNPIndex"
+    assert watcher.snapshot().fingerprint() == digest
+    records = edit(records, random.Random(2))
+    write(path, records, "py")
+    assert watcher.check() is not None
+    assert state(watcher.snapshot()) == rebuild(records)
+
+
+def test_batch_tools_load_the_watched_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "kb.jsonl")
+    records = generate_knowledge_base(30)
+    write(path, records, "jsonl")
+    monkeypatch.setattr(kb_reload, "DEFAULT_SOURCE", path)
+    index = build_default_index()
+    assert state(index) == rebuild(records)
+    assert index.fingerprint() == KnowledgeBaseWatcher(path).snapshot().fingerprint()
@@ -0,0 +1,65 @@
+import os
+
+from report_cache import ReportCache
+
+
+def writer(size):
+    return lambda stream: stream.write(b"x" * size)
+
+
+def age(cache, key, seconds_ago):
+    path = cache.path(key)
+    mtime = os.path.getmtime(path) - seconds_ago
+    os.utime(path, (mtime, mtime))
+
+
+def entries(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".pdf"))
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path):
+    cache = ReportCache("a" * 64, str(tmp_path), max_bytes=300)
+    for i, key in enumerate(["k1", "k2", "k3"]):
+        cache.path_or_build(key, writer(100))
+        age(cache, key, 100 - i * 10)
+    cache.path_or_build("k1", writer(100))  # hit: now the most recently used
+    cache.path_or_build("k4", writer(100))
+    assert entries(tmp_path) == sorted(os.path.basename(cache.path(k)) for k in ["k1", "k3", "k4"])
+
+
+def test_hit_does_not_rebuild(tmp_path):
+    cache = ReportCache("a" * 64, str(tmp_path), max_bytes=1000)
+    path = cache.path_or_build("k", writer(10))
+    assert cache.path_or_build("k", lambda stream: 1 / 0) == path
+
+
+def test_entry_larger_than_the_bound_is_still_returned(tmp_path):
+    cache = ReportCache("a" * 64, str(tmp_path), max_bytes=10)
+    cache.path_or_build("small", writer(5))
+    path = cache.path_or_build("big", writer(100))
+    assert os.path.getsize(path) == 100
+    assert entries(tmp_path) == [os.path.basename(path)]
+
+
+def test_other_fingerprints_survive_until_evicted_by_lru(tmp_path):
+    old = ReportCache("a" * 64, str(tmp_path), max_bytes=250)
+    old_path = old.path_or_build("k", writer(100))
+    age(old, "k", 100)
+    new = ReportCache("b" * 64, str(tmp_path), max_bytes=250)
+    assert os.path.exists(old_path)
+    new.path_or_build("k1", writer(100))
+    assert os.path.exists(old_path)
+    new.path_or_build("k2", writer(100))
+    assert not os.path.exists(old_path)
+    assert len(entries(tmp_path)) == 2
+
+
+def test_bound_covers_entries_written_by_other_caches(tmp_path):
+    first = ReportCache("a" * 64, str(tmp_path), max_bytes=300)
+    for i in range(3):
+        first.path_or_build(f"k{i}", writer(100))
+        age(first, f"k{i}", 100 - i)
+    second = ReportCache("a" * 64, str(tmp_path), max_bytes=300)
+    second.path_or_build("other", writer(100))
+    assert sum(os.path.getsize(tmp_path / name) for name in entries(tmp_path)) <= 300
+    assert not os.path.exists(first.path("k0"))
@@ -0,0 +1,15 @@
+import pytest
+
+from nutrigene_core import build_report, generate_panel_report
+from risk_chart import CHART_MODES
+
+RECORD = {
+    "SNP": "rs1800629", "Gene Name": "TNF", "Genotype": "AA", "Effect": "Higher TNF-α response",
+    "Nutrient": "Omega-3 — fish oil", "Recommendation": "Limit fried food", "Risk Level": "High",
+}
+
+
+@pytest.mark.parametrize("chart_mode", sorted(CHART_MODES))
+def test_reports_accept_non_latin1_text(chart_mode):
+    assert build_report([RECORD], chart_mode).getvalue().startswith(b"%PDF")
+    assert generate_panel_report([RECORD], chart_mode).getvalue().startswith(b"%PDF")
@@ -0,0 +1,35 @@
+import risk_chart
+from risk_chart import save_aggregate_risk_chart, save_risk_chart
+
+
+def fake_png(width=10, height=20):
+    return b"\x89PNG\r\n\x1a\n" + bytes(8) + width.to_bytes(4, "big") + height.to_bytes(4, "big")
+
+
+def test_aggregate_charts_are_bounded_and_rendered_outside_the_locks(monkeypatch):
+    renders = []
+
+    def render(risk_counts, *args):
+        assert not risk_chart._aggregate_cache_lock.locked() and not risk_chart._chart_cache_lock.locked()
+        renders.append(risk_counts["High"])
+        return fake_png()
+
+    monkeypatch.setattr(risk_chart, "render_aggregate_risk_chart", render)
+    monkeypatch.setattr(risk_chart, "AGGREGATE_CACHE_SIZE", 4)
+    monkeypatch.setattr(risk_chart, "_aggregate_cache", risk_chart.OrderedDict())
+    per_level = len(risk_chart._chart_cache)
+
+    for high in range(10):
+        chart = save_aggregate_risk_chart({"Low": 1, "Medium": 2, "High": high})
+        assert (chart.width_px, chart.height_px) == (10, 20)
+    save_aggregate_risk_chart({"Low": 1, "Medium": 2, "High": 9}) # most recent: still cached
+    save_aggregate_risk_chart({"Low": 1, "Medium": 2, "High": 0}) # evicted: rendered again
+
+    assert renders == list(range(10)) + [0]
+    assert len(risk_chart._aggregate_cache) == 4
+    assert len(risk_chart._chart_cache) == per_level
+
+
+def test_per_level_charts_stay_cached():
+    first, second = save_risk_chart("High"), save_risk_chart("High")
+    assert first.getvalue() == second.getvalue() and first.cache_key == second.cache_key
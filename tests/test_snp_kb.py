@@ -0,0 +1,46 @@
+import sqlite3
+
+import pytest
+
+from kb_reload import DEFAULT_SOURCE, load_source
+from snp_index import SNPIndex
+from snp_kb import CompactSNPIndex, compile_knowledge_base, compiled_source_digest
+
+UNUSUAL = [
+    {"SNP": "rs1", "Gene Name": "G1", "Genotype": "AA", "Description": "desc text", "Extra": 5,
+     "Nutrient": "Folate", "Risk Level": "High"},
+    {"Risk Level": "Low", "SNP": "rs1", "Genotype": "AG", "Nutrient": "Folate"}, # another key order
+    {"SNP": "rs2", "Genotype": "CC", "Effect": None, "Nutrient": "Iron", "Risk Level": "Moderate"},
+    {"SNP": "RS3", "Genotype": "tt"}, # sparse, matched case-insensitively
+]
+
+
+@pytest.fixture
+def records():
+    return load_source(DEFAULT_SOURCE)[0] + UNUSUAL
+
+
+def test_compiled_lookups_match_the_in_memory_index(tmp_path, records):
+    path = str(tmp_path / "kb.sqlite")
+    compile_knowledge_base(records, path, "digest")
+    compact, index = CompactSNPIndex(path), SNPIndex(records)
+
+    assert compact.rsids() == index.rsids() and len(compact) == len(index)
+    for rsid in index.rsids():
+        assert compact.lookup(rsid) == index.lookup(rsid)
+        for record in index.lookup(rsid):
+            assert compact.lookup_genotype(rsid, record.get("Genotype", "")) == \
+                index.lookup_genotype(rsid, record.get("Genotype", ""))
+    assert list(compact.records()) == records
+    assert list(compact.lookup("rs1")[0]) == list(UNUSUAL[0]) # key order, which reports render in
+
+
+def test_older_compiled_format_matches_no_source(tmp_path, records):
+    path = str(tmp_path / "kb.sqlite")
+    compile_knowledge_base(records, path, "digest")
+    assert compiled_source_digest(path) == "digest"
+    conn = sqlite3.connect(path)
+    conn.execute("DELETE FROM meta WHERE key = 'format'")
+    conn.commit()
+    conn.close()
+    assert compiled_source_digest(path) is None
@@ -0,0 +1,32 @@
+import time
+
+import pytest
+
+from benchmarks.synthetic_data import generate_knowledge_base
+from snp_search import PrefixSearchIndex
+
+
+@pytest.fixture(scope="module")
+def large_index():
+    return PrefixSearchIndex(generate_knowledge_base(100_000))
+
+
+@pytest.mark.parametrize("query", ["f", "c", "vit", "rs1"])
+def test_search_rsids_stays_fast_on_a_large_knowledge_base(large_index, query):
+    large_index.search_rsids(query) # warm up
+    started = time.perf_counter()
+    for _ in range(20):
+        rsids = large_index.search_rsids(query)
+    elapsed = (time.perf_counter() - started) / 20
+    assert 0 < len(rsids) <= 10 and len(set(rsids)) == len(rsids)
+    # Per keystroke; well under a millisecond here, with headroom for slow CI machines
+    assert elapsed < 0.005
+
+
+def test_search_rsids_keeps_suggestion_order():
+    records = [{"SNP": f"rs{i}", "Gene Name": "FTO", "Nutrient": "Fat"} for i in range(30)]
+    records.append({"SNP": "rs999", "Gene Name": "FADS1", "Nutrient": "Omega-3"})
+    index = PrefixSearchIndex(records)
+    rsids = index.search_rsids("f", limit=5)
+    assert rsids == [s for suggestion in index.search("f", 5) for s in suggestion.rsids][:5]
+    assert len(rsids) == 5